@@ -0,0 +1,239 @@
+import asyncio
+import os
+import threading
+import time
+from urllib.parse import urlencode
+
+import httpx
+
+import fetch
+import metrics
+from cache import MISSING
+
+
+class AsyncOpenLibraryClient:
+    """Async counterpart of `fetch.OpenLibraryClient`.
+
+    Flask runs every async view on its own short-lived event loop, so the
+    httpx client lives on a dedicated loop thread instead; its keep-alive
+    pool is then shared by all requests in the worker, and callers on any
+    loop await responses through `get`.
+    """
+
+    def __init__(
+        self,
+        base_url=fetch.OPENLIBRARY_URL,
+        pool_size=20,
+        connect_timeout=3.05,
+        read_timeout=10,
+        retries=2,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="openlibrary-async", daemon=True
+        )
+        self._thread.start()
+        self._client = self._run(
+            self._open(pool_size, connect_timeout, read_timeout, retries)
+        ).result()
+
+    async def _open(self, pool_size, connect_timeout, read_timeout, retries):
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=httpx.AsyncHTTPTransport(retries=retries),
+        )
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def get(self, path, params=None, headers=None, timeout=None):
+        """GET `path` relative to the base URL; `timeout` overrides the read timeout."""
+
+        kwargs = {"params": params, "headers": headers}
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.connect_timeout)
+        return await asyncio.wrap_future(
+            self._run(self._client.get(path.lstrip("/"), **kwargs))
+        )
+
+    def close(self):
+        self._run(self._client.aclose()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def client_from_env():
+    """Build a client from the same OPENLIBRARY_* variables as fetch.py."""
+
+    env = os.environ
+    return AsyncOpenLibraryClient(
+        base_url=env.get("OPENLIBRARY_URL", fetch.OPENLIBRARY_URL),
+        pool_size=int(env.get("OPENLIBRARY_ASYNC_POOL_SIZE", 20)),
+        connect_timeout=float(env.get("OPENLIBRARY_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(env.get("OPENLIBRARY_READ_TIMEOUT", 10)),
+        retries=int(env.get("OPENLIBRARY_RETRIES", 2)),
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the worker's shared async client, creating it on first use."""
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = client_from_env()
+    return _client
+
+
+def set_client(client):
+    """Replace the shared client, e.g. to point fetchers at a stub server."""
+
+    global _client
+    with _client_lock:
+        old, _client = _client, client
+    if old is not None and old is not client:
+        old.close()
+
+
+def _reset_after_fork():
+    # The loop thread does not survive a fork; start a new one on demand.
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def _get_json(namespace, key, path, params=None, decode=None):
+    data = fetch.get_cache().get(namespace, key)
+    if data is not MISSING:
+        return data
+    return await fetch._flight.do_async(
+        (namespace, key), lambda: _fetch_json(namespace, key, path, params, decode)
+    )
+
+
+async def _peer_result(namespace, key):
+    # Same as fetch._peer_result, without blocking the event loop.
+    fetch._count("shared_waits")
+    cache = fetch.get_cache()
+    deadline = time.monotonic() + fetch.SHARED_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        if not cache.store.locked(f"{namespace}:{key}"):
+            break
+    return cache.get(namespace, key)
+
+
+async def _fetch_json(namespace, key, path, params=None, decode=None):
+    data = fetch.get_cache().get(namespace, key)
+    if data is not MISSING:
+        return data
+    store = fetch._shared_lock(namespace, key)
+    if store is MISSING:
+        data = await _peer_result(namespace, key)
+        if data is not MISSING:
+            return data
+        store = None
+    previous, headers = fetch._validators(namespace, key)
+    breaker = fetch.breaker_for(namespace)
+    try:
+        if not breaker.allow():
+            return fetch._stale(namespace, key, previous, "circuit open")
+        succeeded = False
+        try:
+            with metrics.timed_upstream(namespace):
+                res = await get_client().get(
+                    path, params=params, headers=headers, timeout=fetch.timeout_for(namespace)
+                )
+            data = fetch._remember(namespace, key, res, previous, decode)
+            succeeded = True
+        except (httpx.HTTPError, fetch.UpstreamError) as exc:
+            return fetch._stale(namespace, key, previous, exc)
+        finally:
+            # As in fetch._fetch_json, including when the call is cancelled.
+            if succeeded:
+                breaker.success()
+            else:
+                breaker.failure()
+        return data
+    finally:
+        if store is not None:
+            store.release(f"{namespace}:{key}")
+
+
+async def get_books(subject):
+    return await _get_json(fetch.books_namespace(subject), subject, f"{subject}.json")
+
+
+async def get_authors_details(key):
+    return await _get_json("authors", key, f"{key}.json")
+
+
+async def get_ratings_details(key):
+    return await _get_json("ratings", key, f"{key}/ratings.json")
+
+
+async def search(q, limit=fetch.SEARCH_LIMIT, offset=0, fields=fetch.SEARCH_FIELDS):
+    params = fetch.search_params(q, limit, offset, fields)
+    try:
+        docs = await _get_json(
+            "search", urlencode(params), "search.json", params, fetch._search_docs
+        )
+    except fetch.UpstreamError:
+        fetch.logger.warning("Search for %r failed", q, exc_info=True)
+        return []
+    return [] if docs is None else docs
+
+
+async def author_works(key, limit=fetch.AUTHOR_WORKS_LIMIT, offset=0):
+    params = {"limit": limit, "offset": offset}
+    return await _get_json(
+        "author_works",
+        f"{key}?{urlencode(params)}",
+        f"{key}/works.json",
+        params,
+        fetch._works_page,
+    )
+
+
+async def _lookup(fetcher, key):
+    try:
+        return await fetcher(key)
+    except Exception:
+        fetch.logger.exception("Open Library lookup failed for %s", key)
+        return None
+
+
+async def resolve_books(keys):
+    """Async counterpart of `fetch.resolve_books`."""
+
+    book_keys = [*dict.fromkeys(keys)]
+    books = dict(
+        zip(book_keys, await asyncio.gather(*(_lookup(get_books, k) for k in book_keys)))
+    )
+
+    author_keys = [*dict.fromkeys(filter(None, map(fetch.first_author_key, books.values())))]
+    authors = dict(
+        zip(
+            author_keys,
+            await asyncio.gather(*(_lookup(get_authors_details, k) for k in author_keys)),
+        )
+    )
+
+    return [
+        {"book": books[key], "author": authors.get(fetch.first_author_key(books[key]))}
+        for key in keys
+    ]
@@ -1,49 +1,167 @@
 from email.quoprimime import quote
+import asyncio
+import click
 import os
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+import re
+import time
+from collections.abc import Sequence
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    render_template,
+    request,
+    flash,
+    redirect,
+    session,
+    g,
+    abort,
+    jsonify,
+    send_from_directory,
+    url_for,
+)
+from werkzeug.local import LocalProxy
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+import afetch
 from fetch import (
     get_books,
     get_authors_details,
     get_ratings_details,
     search,
     author_works,
+    resolve_books,
+    first_author_key,
+    submit,
+    UpstreamError,
+)
+from config import PROFILES
+from models import db, connect_db, User, Review, Favorite, Book, BookRating
+from catalog import remember_book, store_resolved, refresh_stale_books
+from search_index import local_search, rebuild as rebuild_search_index
+from trending import trending
+from forms import (
+    UserAddForm,
+    LoginForm,
+    ReviewForm,
+    FavoriteForm,
+    EditReviewForm,
+    FAVORITE_STATUSES,
 )
-from models import db, connect_db, User, Review, Favorite
-from forms import UserAddForm, LoginForm, ReviewForm, FavoriteForm, EditReviewForm
+from identity import load_identity, forget_identity
+from migrations import upgrade as upgrade_db
+import metrics
+import fragments
+import prefetch
+import capture
+from covers import cover as find_cover
+import bulk
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
-app.app_context().push()
+bp = Blueprint("main", __name__, cli_group=None)
 
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
-    "DATABASE_URL", "postgresql:///books_lover"
-)
 
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ECHO"] = False
-app.config["DEBUG_TB_INTERCEPT_REDIRECTS"] = False
-app.config["SECRET_KEY"] = os.environ.get(
-    "SECRET_KEY", "2d24980166707adcbff5305e4175c393"
-)
-toolbar = DebugToolbarExtension(app)
+def create_app(config=None):
+    """Build the app.
+
+    `config` is a profile name from config.PROFILES or a mapping of settings
+    applied over the APP_PROFILE profile (production by default). Tables are
+    created by `flask create-db`, not here.
+    """
 
-connect_db(app)
+    if isinstance(config, str):
+        profile, overrides = config, {}
+    else:
+        profile, overrides = os.environ.get("APP_PROFILE", "production"), config or {}
 
-db.create_all()
+    app = Flask(__name__)
+    app.config.from_object(PROFILES[profile])
+    app.config.update(overrides)
 
+    if app.config["DEBUG_TOOLBAR"]:
+        from flask_debugtoolbar import DebugToolbarExtension
 
-@app.before_request
-def add_user_to_g():
-    """If we're logged in, add curr user to Flask global."""
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    metrics.init_app(app)
+    fragments.init_app(app)
+    capture.init_app(app)
+    app.register_blueprint(bp)
+
+    if app.config["FETCH_ASYNC"]:
+        app.view_functions.update(
+            {
+                "main.search_data": search_data_async,
+                "main.get_book": get_book_async,
+                "main.list": list_async,
+                "main.authors": authors_async,
+            }
+        )
+    return app
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
 
+def current_identity():
+    """Identity of the logged in user, or None; loaded once per request."""
+
+    if "identity" not in g:
+        user_id = session.get(CURR_USER_KEY)
+        g.identity = load_identity(user_id) if user_id is not None else None
+    return g.identity
+
+
+@bp.before_app_request
+def add_user_to_g():
+    """If we're logged in, add curr user to Flask global.
+
+    The user is only looked up when a view or template touches `g.user`.
+    """
+
+    g.pop("identity", None)
+    g.user = LocalProxy(current_identity)
+    # Views may empty the session (e.g. by showing flash messages); the page
+    # is still personal.
+    g.had_session = bool(session)
+
+
+CACHEABLE_ENDPOINTS = {
+    "main.fetch_books",
+    "main.get_book",
+    "main.authors",
+    "main.author_works_page",
+    "main.api_books",
+}
+
+
+@bp.after_app_request
+def add_cache_headers(response):
+    """Send home, book and author pages with an ETag and Cache-Control.
+
+    Pages rendered with an empty session (no login, flash message or CSRF
+    token) before and after the view, and not changing it, are the same for
+    everyone and public for PAGE_CACHE_MAX_AGE seconds. Any other page is
+    private and revalidated on each view, so a response that sets or
+    clears the session cookie is never public.
+    """
+
+    if (
+        request.method != "GET"
+        or request.endpoint not in CACHEABLE_ENDPOINTS
+        or response.status_code != 200
+    ):
+        return response
+    if g.get("had_session") or session or session.modified:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
     else:
-        g.user = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["PAGE_CACHE_MAX_AGE"]
+    response.vary.add("Cookie")
+    response.add_etag()
+    return response.make_conditional(request)
 
 
 def do_login(user):
@@ -56,6 +174,7 @@ def do_logout():
     """Logout user."""
 
     if CURR_USER_KEY in session:
+        forget_identity(session[CURR_USER_KEY])
         del session[CURR_USER_KEY]
 
 
@@ -63,7 +182,7 @@ def do_logout():
 # User Authentication/Registration
 
 
-@app.route("/signup", methods=["GET", "POST"])
+@bp.route("/signup", methods=["GET", "POST"])
 def signup():
     """Handle user signup."""
 
@@ -91,7 +210,7 @@ def signup():
         return render_template("users/signup.html", form=form)
 
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     """Handle user login"""
 
@@ -101,6 +220,8 @@ def login():
         user = User.authenticate(form.username.data, form.password.data)
 
         if user:
+            # Persists a password rehashed at the current bcrypt cost.
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -110,7 +231,7 @@ def login():
     return render_template("users/login.html", form=form)
 
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     """Handle user logout."""
 
@@ -123,55 +244,169 @@ def logout():
 # Search for books or authors
 
 
-@app.route("/search", methods=["POST"])
+SEARCH_PAGE_SIZE = 18
+
+
+def search_args():
+    """Query and 1-based page number of a search request."""
+    args = request.form if request.method == "POST" else request.args
+    page = max(args.get("page", 1, type=int), 1)
+    return args.get("q", ""), page
+
+
+def search_local_first(q, page):
+    """Search the local index, unless it misses or remote results are requested.
+
+    Returns the docs and which source ("local" or "remote") answered.
+    """
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    if request.args.get("source") != "remote":
+        docs = local_search(q, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+        if docs or request.args.get("source") == "local":
+            return docs, "local"
+    return None, "remote"
+
+
+def prefetch_books(books):
+    """Warm the caches behind the first book pages a listing links to."""
+    top = current_app.config["PREFETCH_TOP"]
+    if top:
+        prefetch.warm([book["key"] for book in books[:top] if book.get("key")])
+
+
+def render_search(q, page, docs, source):
+    prefetch_books(docs)
+    # One extra doc is requested to tell whether a next page exists.
+    return render_template(
+        "users/show.html",
+        books=docs[:SEARCH_PAGE_SIZE],
+        q=q,
+        page=page,
+        source=source,
+        has_next=len(docs) > SEARCH_PAGE_SIZE,
+    )
+
+
+@bp.route("/search", methods=["GET", "POST"])
 def search_data():
     """Search for books or authors."""
-    args = request.form
-    response = args.get("q")
-    books = search(response)[:18]
-    return render_template("users/show.html", books=books)
+    q, page = search_args()
+    docs, source = search_local_first(q, page)
+    if docs is None:
+        docs = search(
+            q, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE
+        )
+    return render_search(q, page, docs, source)
 
 
 ###############################################################################################
 # Fetch books for a homepage
 
 
-@app.route("/")
+@bp.route("/")
 def fetch_books():
     """Fetches books for home page."""
-    limit = 18
-    data = get_books("/trending/yearly")
-    books = data.get("works")[:limit]
+    books = trending.get()
+    prefetch_books(books)
     return render_template("home.html", books=books)
 
 
-@app.route("/<path:key>/<title>", methods=["GET"])
-def get_book(key, title):
-    """Returns information about one particular book."""
-    book = get_books(key)
+REVIEWS_PAGE_SIZE = 10
 
-    if "authors" in book and book["authors"]:
-        author = get_authors_details(book["authors"][0]["author"]["key"])
-    else:
-        author = None
 
-    rating = get_ratings_details(key)
-    reviews = Review.query.filter_by(book_id=key).all()
-    form = FavoriteForm()
-    form2 = ReviewForm()
+def book_reviews(key):
+    """Newest reviews of a book with their authors, paginated by `?page=`.
+
+    Returns the page of reviews, the page number and whether a next page
+    exists; one extra row is fetched instead of counting every review.
+    """
+    page = max(request.args.get("page", 1, type=int), 1)
+    reviews = (
+        Review.query.options(joinedload(Review.user))
+        .filter_by(book_id=key)
+        .order_by(Review.timestamp.desc(), Review.id.desc())
+        .offset((page - 1) * REVIEWS_PAGE_SIZE)
+        .limit(REVIEWS_PAGE_SIZE + 1)
+        .all()
+    )
+    return reviews[:REVIEWS_PAGE_SIZE], page, len(reviews) > REVIEWS_PAGE_SIZE
+
+
+def book_with_author(key):
+    """Fetch a work and then its first author; runs on the fetch pool.
+
+    The page can do without the author, so failing to fetch it is not fatal.
+    """
+    book = get_books(key)
+    author_key = first_author_key(book)
+    try:
+        author = get_authors_details(author_key) if author_key else None
+    except UpstreamError:
+        current_app.logger.warning("No author details for %s", key)
+        author = None
+    return book, author
+
+
+def book_or_stored(key, found):
+    """The fetched `(book, author)`, or our stored copy if the fetch failed.
+
+    Aborts with 504 when Open Library failed and the book was never stored.
+    """
+    if found is not None:
+        book, author = found
+        remember_book(key, book, author)
+        return book, author
+    stored = db.session.get(Book, key)
+    if stored is None:
+        abort(504)
+    return stored, stored.author
+
+
+def wait_for(future, deadline, default=None):
+    """Result of `future`, or `default` if it fails or misses the deadline."""
+    try:
+        return future.result(timeout=max(deadline - time.monotonic(), 0))
+    except FutureTimeoutError:
+        current_app.logger.warning("Open Library call missed the page deadline")
+    except UpstreamError as e:
+        current_app.logger.warning("%s", e)
+    except Exception:
+        current_app.logger.exception("Open Library call failed")
+    return default
+
+
+@bp.route("/<path:key>/<title>", methods=["GET"])
+def get_book(key, title):
+    """Returns information about one particular book."""
+    deadline = time.monotonic() + current_app.config["BOOK_PAGE_DEADLINE"]
+    book_future = submit(book_with_author, key)
+    rating_future = submit(get_ratings_details, key)
+
+    # The database queries overlap with the upstream calls.
+    reviews, page, has_next = book_reviews(key)
+    community = db.session.get(BookRating, key)
+
+    book, author = book_or_stored(key, wait_for(book_future, deadline))
+    rating = wait_for(rating_future, deadline)
+    # Forms put a CSRF token in the session; anonymous pages stay shareable.
+    form = FavoriteForm() if g.user else None
+    form2 = ReviewForm() if g.user else None
     return render_template(
         "users/book.html",
         book=book,
         title=title,
         author=author,
         rating=rating,
+        community=community,
         reviews=reviews,
+        page=page,
+        has_next=has_next,
         form=form,
         form2=form2,
     )
 
 
-@app.route("/<path:key>/<title>", methods=["POST"])
+@bp.route("/<path:key>/<title>", methods=["POST"])
 def book_details(key, title):
     """Allows user to make a comment on a book and gives user ability to add specific book to favorites."""
     if not g.user:
@@ -185,17 +420,25 @@ def book_details(key, title):
     if not exists:
         if request.method == "POST" and form.validate_on_submit():
             status = form.status.data
-            favorite = Favorite(status=status, book_id=key)
-            g.user.favorite.append(favorite)
-            db.session.commit()
+            favorite = Favorite(status=status, book_id=key, user_id=g.user.id)
+            db.session.add(favorite)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # A concurrent request added the same book first.
+                db.session.rollback()
+            else:
+                remember_book(key, book)
             flash("Successfully added.", "success")
             return redirect(f"/{key}/{title}")
 
     if request.method == "POST" and form2.validate_on_submit():
         text = form2.text.data
         user_rating = form2.user_rating.data
-        review = Review(text=text, user_rating=user_rating, book_id=key)
-        g.user.review.append(review)
+        review = Review(
+            text=text, user_rating=user_rating, book_id=key, user_id=g.user.id
+        )
+        db.session.add(review)
         db.session.commit()
         flash("Review added successfully.", "success")
         return redirect(f"/{key}/{title}")
@@ -203,10 +446,10 @@ def book_details(key, title):
     return render_template("users/book.html", form=form, form2=form2, book=book)
 
 
-@app.route("/<path:key>/<title>/edit", methods=["GET", "POST"])
+@bp.route("/<path:key>/<title>/edit", methods=["GET", "POST"])
 def edit_review(key, title):
     """Allows editing of a review."""
-    if not g.user.id:
+    if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
     review = (
@@ -226,7 +469,7 @@ def edit_review(key, title):
     return render_template("users/edit.html", form=form, review=review)
 
 
-@app.route("/<path:key>/<title>/delete", methods=["POST"])
+@bp.route("/<path:key>/<title>/delete", methods=["POST"])
 def destroy_review(key, title):
     """Delete a review."""
     if not g.user:
@@ -247,34 +490,85 @@ def destroy_review(key, title):
 #######################################################################################
 
 
-@app.route("/my/list")
+@bp.route("/my/list")
 def list():
     """Shows user's favorite books."""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
+    favs, next_after = favorites_with_books()
+    missing = unknown_books(favs)
+    books = store_resolved(missing, resolve_books(missing)) if missing else {}
+    return render_favorites(favs, books, next_after)
+
+
+FAVORITES_PAGE_SIZE = 24
+
+
+def favorites_with_books():
+    """One page of the current user's favorites, joined with stored details.
+
+    Pages are keyed on the last favorite id seen (`?after=`) and can be
+    narrowed with `?status=`. Returns the page and the `after` value of the
+    next page, or None on the last page.
+    """
+    query = Favorite.query.filter(
+        Favorite.user_id == g.user.id,
+        Favorite.id > request.args.get("after", 0, type=int),
+    )
+    status = request.args.get("status")
+    if status:
+        query = query.filter(Favorite.status == status)
+    favs = (
+        query.options(joinedload(Favorite.book).joinedload(Book.author))
+        .order_by(Favorite.id)
+        .limit(FAVORITES_PAGE_SIZE + 1)
+        .all()
+    )
+    if len(favs) > FAVORITES_PAGE_SIZE:
+        favs = favs[:FAVORITES_PAGE_SIZE]
+        return favs, favs[-1].id
+    return favs, None
+
+
+def render_favorites(favs, fetched, next_after):
+    return render_template(
+        "users/favs.html",
+        books=favorite_cards(favs, fetched),
+        statuses=FAVORITE_STATUSES,
+        status=request.args.get("status"),
+        after=request.args.get("after", type=int),
+        next_after=next_after,
+    )
+
+
+def unknown_books(favs):
+    """Keys of favorited books whose details have not been stored yet."""
+    return [*dict.fromkeys(b.book_id for b in favs if b.book is None)]
+
+
+def favorite_cards(favs, fetched):
+    """Pair favorites with their books for the favorites template.
+
+    Stored details are used when present, otherwise the Book in `fetched`.
+    """
     books = []
-    favs = Favorite.query.all()
     for b in favs:
-        book_id = b.book_id
-        book = get_books(book_id)
-        author_key = book["authors"][0]["author"]["key"]
-        author = get_authors_details(author_key)
-        status = b.status
-        id = b.id
-        books.append({"id": id, "book": book, "author": author, "status": status})
-    return render_template("users/favs.html", books=books)
+        book = b.book or fetched[b.book_id]
+        books.append(
+            {"id": b.id, "book": book, "author": book.author, "status": b.status}
+        )
+    return books
 
 
-@app.route("/my/list/<int:id>/delete", methods=["POST"])
+@bp.route("/my/list/<int:id>/delete", methods=["POST"])
 def destroy_choice(id):
     """Allows users to delete books from the favorites."""
     if not g.user:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    book = Favorite.query.get_or_404(id)
-    print(book)
+    book = Favorite.query.filter_by(id=id, user_id=g.user.id).first_or_404()
     db.session.delete(book)
     db.session.commit()
     return redirect("/my/list")
@@ -284,18 +578,448 @@ def destroy_choice(id):
 # Authors information page
 
 
-@app.route("/<path:key>/author", methods=["GET", "POST"])
+AUTHOR_WORKS_PAGE_SIZE = 10
+
+
+def works_offset():
+    return max(request.args.get("offset", 0, type=int), 0)
+
+
+def works_page(page, offset):
+    """The works of an author works page and the next page's offset, or None."""
+    works = (page.get("entries") or [])[:AUTHOR_WORKS_PAGE_SIZE]
+    next_offset = offset + len(works)
+    if works and (page.get("size") or 0) > next_offset:
+        return works, next_offset
+    return works, None
+
+
+def listed_works(key, offset=0):
+    """A page of an author's works; the page shows none if Open Library fails."""
+    try:
+        return works_page(author_works(key, AUTHOR_WORKS_PAGE_SIZE, offset), offset)
+    except UpstreamError:
+        return [], None
+
+
+def render_author(key, author, works, next_offset):
+    return render_template(
+        "users/author.html",
+        author=author,
+        works=works,
+        next_offset=next_offset,
+        author_id=key.rstrip("/").rpartition("/")[2],
+    )
+
+
+@bp.route("/<path:key>/author", methods=["GET", "POST"])
 def authors(key):
     """Shows author's details."""
     author = get_authors_details(key)
-    data = author_works(key)
-    works = data.get("entries")[:10]
-    return render_template("users/author.html", author=author, works=works)
+    works, next_offset = listed_works(key, works_offset())
+    return render_author(key, author, works, next_offset)
+
+
+@bp.route("/api/authors/<author_id>/works")
+def author_works_page(author_id):
+    """A page of an author's works as JSON, for loading more on the author page."""
+    offset = works_offset()
+    try:
+        page = author_works(f"authors/{author_id}", AUTHOR_WORKS_PAGE_SIZE, offset)
+    except UpstreamError as e:
+        current_app.logger.warning("%s", e)
+        return jsonify(error="Open Library is unavailable"), 503, {"Retry-After": "30"}
+    works, next_offset = works_page(page, offset)
+    return jsonify(
+        works=[
+            {
+                "key": work["key"],
+                "title": work["title"],
+                "url": url_for(
+                    "main.get_book",
+                    key=work["key"],
+                    title=(work["title"] or "").replace(" ", "_"),
+                ),
+            }
+            for work in works
+        ],
+        next_offset=next_offset,
+    )
+
+
+########################################################################################
+# Batched book lookups
+
+
+BOOK_FIELDS = ("title", "cover", "author", "rating", "community")
+BOOK_KEY = re.compile(r"^/?works/OL\d+W$")
+
+
+def is_strings(value):
+    """Whether `value` is a JSON array of strings."""
+    return (
+        isinstance(value, Sequence)
+        and not isinstance(value, str)
+        and all(isinstance(item, str) for item in value)
+    )
+
+
+def requested_books():
+    """Keys and fields of a `/api/books` request, from the query or a JSON body.
+
+    Keys and fields are lists in a JSON body and comma separated in the
+    query string. Aborts with 400 if the body is not a JSON object or either
+    is missing or invalid.
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400)
+        keys, fields = body.get("keys"), body.get("fields")
+    else:
+        keys = request.args.get("keys", "").split(",")
+        fields = request.args.get("fields")
+        fields = fields.split(",") if fields else None
+    fields = BOOK_FIELDS if fields is None else fields
+    if not is_strings(keys) or not is_strings(fields) or not set(fields) <= set(BOOK_FIELDS):
+        abort(400)
+    keys = [*dict.fromkeys(key.strip() for key in keys if key.strip())]
+    if not keys or len(keys) > current_app.config["API_BOOKS_MAX"]:
+        abort(400)
+    return keys, fields
+
+
+def stored_book_details(keys):
+    """Stored Books and community ratings for `keys`, with or without a leading slash."""
+    variants = {variant: key for key in keys for variant in (key, "/" + key)}
+    books = Book.query.options(joinedload(Book.author)).filter(Book.key.in_(variants))
+    ratings = BookRating.query.filter(BookRating.book_id.in_(variants))
+    return (
+        {variants[book.key]: book for book in books},
+        {variants[rating.book_id]: rating for rating in ratings},
+    )
+
+
+def book_summary(book, author, rating, community, fields):
+    """Compact JSON description of a book; `book` is a payload or a stored Book."""
+    if isinstance(book, Book):
+        title, covers = book.title, book.covers
+        author = {"key": book.author.key, "name": book.author.name} if book.author else None
+    else:
+        title, covers = book.get("title"), book.get("covers")
+        if author:
+            author = {"key": author.get("key"), "name": author.get("name")}
+    summary = {}
+    if "title" in fields:
+        summary["title"] = title
+    if "cover" in fields:
+        cover_id = next((c for c in covers or () if c and c > 0), None)
+        summary["cover"] = (
+            url_for("main.cover", kind="id", value=cover_id, size="M") if cover_id else None
+        )
+    if "author" in fields:
+        summary["author"] = author
+    if "rating" in fields:
+        ratings = (rating or {}).get("summary") or {}
+        summary["rating"] = (
+            {"average": ratings["average"], "count": ratings.get("count")}
+            if ratings.get("average") is not None
+            else None
+        )
+    if "community" in fields:
+        summary["community"] = (
+            {"average": community.average, "count": community.review_count}
+            if community and community.review_count
+            else None
+        )
+    return summary
+
+
+@bp.route("/api/books", methods=["GET", "POST"])
+def api_books():
+    """Title, cover, author and ratings of many books at once.
+
+    Every key is answered under `books` or, if it cannot be, under `errors`;
+    one failing book does not fail the others.
+    """
+    keys, fields = requested_books()
+    books, errors = {}, {}
+    valid = [key for key in keys if BOOK_KEY.match(key)]
+    for key in keys:
+        if key not in valid:
+            errors[key] = "invalid key"
+
+    # Route keys have no leading slash; sharing them shares the pages' cache.
+    lookup = [key.lstrip("/") for key in valid]
+    ratings = {}
+    if "rating" in fields:
+        ratings = {key: submit(get_ratings_details, key) for key in lookup}
+    resolved = resolve_books(lookup, with_authors="author" in fields) if lookup else []
+    stored, community = stored_book_details(lookup)
+
+    for key, lookup_key, found in zip(valid, lookup, resolved):
+        book, author = found["book"], found["author"]
+        if not isinstance(book, dict):
+            # Open Library failed or sent something unusable; describe the
+            # book from our stored copy.
+            book = stored.get(lookup_key)
+        elif not book.get("title"):
+            errors[key] = "not found"
+            continue
+        if book is None:
+            errors[key] = "unavailable"
+            continue
+        rating = None
+        if lookup_key in ratings:
+            try:
+                rating = ratings[lookup_key].result()
+            except Exception as e:
+                current_app.logger.warning("No ratings for %s: %s", key, e)
+        if not isinstance(author, dict):
+            author = None
+        if not isinstance(rating, dict):
+            rating = None
+        try:
+            books[key] = book_summary(book, author, rating, community.get(lookup_key), fields)
+        except Exception:
+            current_app.logger.exception("Describing %s failed", key)
+            errors[key] = "unavailable"
+    return jsonify(books=books, errors=errors)
+
+
+########################################################################################
+# Cover images
+
+
+@bp.route("/covers/<any(id, olid, isbn, author):kind>/<value>-<any(S, M, L):size>")
+def cover(kind, value, size):
+    """Serves a resized cover from the local cover cache."""
+    webp = request.accept_mimetypes["image/webp"] > 0
+    found = find_cover(kind, value, size, webp)
+    if found is None:
+        return send_from_directory(
+            current_app.static_folder, "images/default-placeholder.png", max_age=300
+        )
+    data, mimetype = found
+    response = Response(data, mimetype=mimetype)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config["COVER_MAX_AGE"]
+    response.vary.add("Accept")
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+########################################################################################
+# Command line
+
+
+@bp.cli.command("rebuild-search-index")
+def rebuild_search_index_command():
+    """Rebuild the local search index from cached, favorited and reviewed works."""
+    keys = {b.book_id for b in Favorite.query.with_entities(Favorite.book_id)}
+    keys.update(r.book_id for r in Review.query.with_entities(Review.book_id))
+    count = rebuild_search_index(sorted(keys))
+    print(f"Indexed {count} works.")
+
+
+@bp.cli.command("create-db")
+def create_db_command():
+    """Create any missing tables."""
+    db.create_all()
+
+
+@bp.cli.command("upgrade-db")
+def upgrade_db_command():
+    """Bring tables created by older versions up to the current models."""
+    db.create_all()
+    upgrade_db()
+
+
+@bp.cli.command("refresh-books")
+@click.option("--limit", default=100, help="Most books to refresh in this run.")
+def refresh_books_command(limit):
+    """Refresh the stalest stored book details from Open Library."""
+    count = refresh_stale_books(limit)
+    print(f"Refreshed {count} books.")
+
+
+@bp.cli.command("warm-cache")
+@click.option("--rate", default=5.0, help="Most Open Library requests per second.")
+@click.option("--workers", default=4, help="Books warmed concurrently.")
+def warm_cache_command(rate, workers):
+    """Preload the trending list and every favorited or reviewed book."""
+    books = trending.value if trending.refresh() else []
+    keys = [book["key"] for book in books if book.get("key")]
+    keys += [b.book_id for b in Favorite.query.with_entities(Favorite.book_id).distinct()]
+    keys += [r.book_id for r in Review.query.with_entities(Review.book_id).distinct()]
+    keys = [*dict.fromkeys(key.lstrip("/") for key in keys)]
+    warmer = prefetch.Prefetcher(workers, rate, burst=workers, max_pending=len(keys))
+    for future in warmer.warm(keys):
+        future.result()
+    print(f"Warmed {warmer.counts['warmed']} books, {warmer.counts['failed']} failed.")
+
+
+format_option = click.option(
+    "--format", "fmt", type=click.Choice(["jsonl", "csv"]), help="Defaults to the file extension."
+)
+batch_option = click.option("--batch-size", default=1000, help="Rows per insert or fetch.")
+
+
+@bp.cli.command("import-favorites")
+@click.argument("source", type=click.File("r"))
+@format_option
+@batch_option
+@click.option(
+    "--on-conflict",
+    type=click.Choice(["skip", "update"]),
+    default="skip",
+    help="Keep or overwrite the status of books a user already listed.",
+)
+def import_favorites_command(source, fmt, batch_size, on_conflict):
+    """Import favorites from a JSONL or CSV file ("-" reads stdin)."""
+    records = bulk.read_records(source, bulk.file_format(source.name, fmt))
+    bulk.import_favorites(records, batch_size, on_conflict)
+
+
+@bp.cli.command("import-reviews")
+@click.argument("source", type=click.File("r"))
+@format_option
+@batch_option
+@click.option(
+    "--on-conflict",
+    type=click.Choice(["skip", "append"]),
+    default="skip",
+    help="Skip or add reviews of books a user already reviewed.",
+)
+def import_reviews_command(source, fmt, batch_size, on_conflict):
+    """Import reviews from a JSONL or CSV file ("-" reads stdin)."""
+    records = bulk.read_records(source, bulk.file_format(source.name, fmt))
+    bulk.import_reviews(records, batch_size, on_conflict)
+
+
+@bp.cli.command("export-favorites")
+@click.argument("target", type=click.File("w"))
+@format_option
+@batch_option
+def export_favorites_command(target, fmt, batch_size):
+    """Export every favorite as JSONL or CSV ("-" writes stdout)."""
+    writer = bulk.RecordWriter(target, bulk.file_format(target.name, fmt), bulk.FAVORITE_FIELDS)
+    bulk.export_favorites(writer, batch_size)
+
+
+@bp.cli.command("export-reviews")
+@click.argument("target", type=click.File("w"))
+@format_option
+@batch_option
+def export_reviews_command(target, fmt, batch_size):
+    """Export every review as JSONL or CSV ("-" writes stdout)."""
+    writer = bulk.RecordWriter(target, bulk.file_format(target.name, fmt), bulk.REVIEW_FIELDS)
+    bulk.export_reviews(writer, batch_size)
+
+
+########################################################################################
+# Async variants of the upstream-heavy views, enabled with FETCH_ASYNC
+
+
+async def search_data_async():
+    """Search for books or authors."""
+    q, page = search_args()
+    docs, source = search_local_first(q, page)
+    if docs is None:
+        docs = await afetch.search(
+            q, limit=SEARCH_PAGE_SIZE + 1, offset=(page - 1) * SEARCH_PAGE_SIZE
+        )
+    return render_search(q, page, docs, source)
+
+
+async def book_with_author_async(key):
+    book = await afetch.get_books(key)
+    author_key = first_author_key(book)
+    try:
+        author = await afetch.get_authors_details(author_key) if author_key else None
+    except UpstreamError:
+        current_app.logger.warning("No author details for %s", key)
+        author = None
+    return book, author
+
+
+async def wait_for_async(task, deadline, default=None):
+    """Async counterpart of `wait_for`."""
+    try:
+        return await asyncio.wait_for(task, max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        current_app.logger.warning("Open Library call missed the page deadline")
+    except UpstreamError as e:
+        current_app.logger.warning("%s", e)
+    except Exception:
+        current_app.logger.exception("Open Library call failed")
+    return default
+
+
+async def get_book_async(key, title):
+    """Returns information about one particular book."""
+    deadline = time.monotonic() + current_app.config["BOOK_PAGE_DEADLINE"]
+    book_task = asyncio.ensure_future(book_with_author_async(key))
+    rating_task = asyncio.ensure_future(afetch.get_ratings_details(key))
+
+    reviews, page, has_next = book_reviews(key)
+    community = db.session.get(BookRating, key)
+
+    book, author = book_or_stored(key, await wait_for_async(book_task, deadline))
+    rating = await wait_for_async(rating_task, deadline)
+    return render_template(
+        "users/book.html",
+        book=book,
+        title=title,
+        author=author,
+        rating=rating,
+        community=community,
+        reviews=reviews,
+        page=page,
+        has_next=has_next,
+        form=FavoriteForm() if g.user else None,
+        form2=ReviewForm() if g.user else None,
+    )
+
+
+async def list_async():
+    """Shows user's favorite books."""
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    favs, next_after = favorites_with_books()
+    missing = unknown_books(favs)
+    books = store_resolved(missing, await afetch.resolve_books(missing)) if missing else {}
+    return render_favorites(favs, books, next_after)
+
+
+async def listed_works_async(key, offset=0):
+    """Async counterpart of `listed_works`."""
+    try:
+        page = await afetch.author_works(key, AUTHOR_WORKS_PAGE_SIZE, offset)
+    except UpstreamError:
+        return [], None
+    return works_page(page, offset)
+
+
+async def authors_async(key):
+    """Shows author's details."""
+    author, (works, next_offset) = await asyncio.gather(
+        afetch.get_authors_details(key), listed_works_async(key, works_offset())
+    )
+    return render_author(key, author, works, next_offset)
 
 
 ########################################################################################
 # Error handling
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def page_not_found(e):
     """Error handling."""
     return render_template("404.html"), 404
+
+
+@bp.app_errorhandler(UpstreamError)
+def upstream_unavailable(e):
+    """Open Library is failing and we have nothing cached to show instead."""
+    current_app.logger.warning("%s", e)
+    return render_template("503.html"), 503, {"Retry-After": "30"}
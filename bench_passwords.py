@@ -0,0 +1,58 @@
+"""Report bcrypt logins per second per core at each cost.
+
+    python bench_passwords.py --costs 10 11 12 13 --seconds 3
+
+A login is one `check_password` call. The single-core figure runs checks
+back to back in this process; the pool figure runs them through a HashPool
+with one process per core, as the app does.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import passwords
+from passwords import HashPool
+
+
+def logins_per_second(check, hashed, seconds):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        check(hashed, "correct horse battery")
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def pool_logins_per_second(pool, hashed, seconds, callers):
+    def worker():
+        return logins_per_second(
+            lambda h, p: pool.run(passwords._check, h, p), hashed, seconds
+        )
+
+    with ThreadPoolExecutor(max_workers=callers) as threads:
+        return sum(threads.map(lambda _: worker(), range(callers)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--costs", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    pool = HashPool(workers=args.workers)
+    pool.run(passwords._check, passwords._hash("warm up", 4), "warm up")
+
+    print(f"{'cost':>4}  {'ms/login':>9}  {'logins/s/core':>13}  {'pool logins/s':>13}")
+    for cost in args.costs:
+        hashed = passwords._hash("correct horse battery", cost)
+        single = logins_per_second(passwords._check, hashed, args.seconds)
+        pooled = pool_logins_per_second(pool, hashed, args.seconds, args.workers * 2)
+        print(f"{cost:>4}  {1000 / single:>9.1f}  {single:>13.1f}  {pooled:>13.1f}")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
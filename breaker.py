@@ -0,0 +1,53 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for a while.
+
+    After `threshold` consecutive failures the breaker opens and `allow()`
+    refuses calls for `reset_after` seconds. Then one trial call is let
+    through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold=5, reset_after=30):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None or self._trial:
+                    self.trips += 1
+                self.opened_at = time.monotonic()
+                self._trial = False
@@ -0,0 +1,284 @@
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, text
+
+from models import db, User, Favorite, Review, _adjust_rating, _rating
+
+FAVORITE_FIELDS = ("user_id", "username", "book_id", "status")
+REVIEW_FIELDS = ("user_id", "username", "book_id", "text", "user_rating", "timestamp")
+
+
+def file_format(path, fmt=None):
+    """"csv" or "jsonl", from `fmt` or the file extension."""
+
+    if fmt:
+        return fmt
+    return "csv" if str(path).lower().endswith(".csv") else "jsonl"
+
+
+def read_records(f, fmt):
+    """Iterate over the records of a JSONL or CSV file as dicts."""
+
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+class RecordWriter:
+    """Writes dicts with `fields` as JSONL or CSV."""
+
+    def __init__(self, f, fmt, fields):
+        self.f = f
+        self.fields = fields
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(f, fieldnames=fields)
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is not None:
+            self._csv.writerow(record)
+        else:
+            self.f.write(json.dumps(record) + "\n")
+
+
+class Progress:
+    """Counts rows and reports throughput to stderr every `every` seconds."""
+
+    def __init__(self, label, every=2.0, out=sys.stderr):
+        self.label = label
+        self.every = every
+        self.out = out
+        self.counts = defaultdict(int)
+        self.start = self._last = time.monotonic()
+
+    def add(self, **counts):
+        for name, count in counts.items():
+            self.counts[name] += count
+        if time.monotonic() - self._last >= self.every:
+            self.report()
+
+    def report(self):
+        self._last = time.monotonic()
+        elapsed = max(self._last - self.start, 1e-9)
+        parts = ", ".join(f"{count} {name}" for name, count in self.counts.items())
+        rate = self.counts["read"] / elapsed
+        print(f"{self.label}: {parts} ({rate:,.0f} rows/s)", file=self.out, flush=True)
+
+
+def _batches(records, size):
+    records = iter(records)
+    while batch := list(itertools.islice(records, size)):
+        yield batch
+
+
+class UserIds:
+    """Resolves the `user_id` or `username` of imported rows, a batch at a time.
+
+    Rows naming a user that does not exist get a `user_id` of None.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._ids = set()
+
+    def resolve(self, rows):
+        names = {r["username"] for r in rows if not r.get("user_id") and r.get("username")}
+        if names - self._names.keys():
+            found = db.session.execute(
+                select(User.username, User.id).where(
+                    User.username.in_(names - self._names.keys())
+                )
+            )
+            for username, user_id in found:
+                self._names[username] = user_id
+                self._ids.add(user_id)
+        ids = {int(r["user_id"]) for r in rows if r.get("user_id")}
+        if ids - self._ids:
+            self._ids.update(
+                db.session.execute(select(User.id).where(User.id.in_(ids - self._ids))).scalars()
+            )
+        for row in rows:
+            user_id = row.get("user_id") or self._names.get(row.get("username"))
+            row["user_id"] = int(user_id) if user_id and int(user_id) in self._ids else None
+        return rows
+
+
+def _copy(connection, table, columns, rows):
+    """Load `rows` into `table` with COPY on Postgres, executemany elsewhere."""
+
+    if not rows:
+        return
+    if connection.dialect.name == "postgresql":
+        buf = io.StringIO()
+        csv.writer(buf).writerows([[row[c] for c in columns] for row in rows])
+        buf.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf
+        )
+        return
+    placeholders = ", ".join(f":{c}" for c in columns)
+    connection.execute(
+        text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"),
+        [{c: row[c] for c in columns} for row in rows],
+    )
+
+
+FAVORITE_STAGING = (
+    "CREATE TEMPORARY TABLE IF NOT EXISTS import_favorites"
+    " (user_id INTEGER, book_id TEXT, status TEXT)"
+)
+FAVORITE_MERGE = """
+INSERT INTO favorites (user_id, book_id, status)
+SELECT s.user_id, s.book_id, s.status FROM import_favorites s
+WHERE true
+ON CONFLICT (user_id, book_id) DO {action}
+"""
+
+
+def import_favorites(records, batch_size=1000, on_conflict="skip", progress=None):
+    """Insert favorites in batches; returns the counts of the import.
+
+    Rows for a `(user_id, book_id)` pair that is already listed are skipped,
+    or with `on_conflict="update"` replace the stored status; of the rows
+    repeating a pair within a batch only the last is used. Both count as
+    conflicts. Rows naming an unknown user or no book are rejected.
+    """
+
+    progress = progress or Progress("favorites")
+    action = "UPDATE SET status = excluded.status" if on_conflict == "update" else "NOTHING"
+    users = UserIds()
+    for batch in _batches(records, batch_size):
+        valid = [r for r in users.resolve(batch) if r["user_id"] and r.get("book_id")]
+        # A pair can only be merged once per statement; the last row wins.
+        rows = {(row["user_id"], row["book_id"]): row for row in valid}
+        # Each batch may run on a different pooled connection.
+        connection = db.session.connection()
+        connection.execute(text(FAVORITE_STAGING))
+        connection.execute(text("DELETE FROM import_favorites"))
+        _copy(connection, "import_favorites", ("user_id", "book_id", "status"), rows.values())
+        merged = connection.execute(text(FAVORITE_MERGE.format(action=action))).rowcount
+        db.session.commit()
+        progress.add(
+            read=len(batch),
+            written=merged,
+            conflicts=len(valid) - merged,
+            rejected=len(batch) - len(valid),
+        )
+    progress.report()
+    return dict(progress.counts)
+
+
+def _existing_reviews(rows):
+    users = {row["user_id"] for row in rows}
+    books = {row["book_id"] for row in rows}
+    found = db.session.execute(
+        select(Review.user_id, Review.book_id).where(
+            Review.user_id.in_(users), Review.book_id.in_(books)
+        )
+    )
+    return set(found.all())
+
+
+def import_reviews(records, batch_size=1000, on_conflict="skip", progress=None):
+    """Insert reviews in batches; returns the counts of the import.
+
+    Reviews by a user of a book they already reviewed are skipped, unless
+    `on_conflict="append"`. Community ratings are updated with each batch.
+    """
+
+    progress = progress or Progress("reviews")
+    users = UserIds()
+    columns = ("user_id", "book_id", "text", "user_rating", "timestamp")
+    for batch in _batches(records, batch_size):
+        rows = [
+            r for r in users.resolve(batch) if r["user_id"] and r.get("book_id") and r.get("text")
+        ]
+        rejected = len(batch) - len(rows)
+
+        if on_conflict != "append":
+            seen = _existing_reviews(rows) if rows else set()
+            unique = []
+            for row in rows:
+                if (row["user_id"], row["book_id"]) not in seen:
+                    seen.add((row["user_id"], row["book_id"]))
+                    unique.append(row)
+            conflicts, rows = len(rows) - len(unique), unique
+        else:
+            conflicts = 0
+
+        for row in rows:
+            row["text"] = row["text"][: Review.text.type.length]
+            row["user_rating"] = _rating(row.get("user_rating")) or None
+            row["timestamp"] = row.get("timestamp") or datetime.utcnow().isoformat(" ")
+        connection = db.session.connection()
+        _copy(connection, "comments", columns, rows)
+        # Bulk inserts bypass the Review mapper events that keep the
+        # community ratings current.
+        totals = defaultdict(lambda: [0, 0])
+        for row in rows:
+            totals[row["book_id"]][0] += 1
+            totals[row["book_id"]][1] += row["user_rating"] or 0
+        for book_id, (count, total) in totals.items():
+            _adjust_rating(connection, book_id, count, total)
+        db.session.commit()
+        progress.add(read=len(batch), written=len(rows), conflicts=conflicts, rejected=rejected)
+    progress.report()
+    return dict(progress.counts)
+
+
+def _stream(query, batch_size):
+    # yield_per streams from a server-side cursor on Postgres.
+    return db.session.execute(query.execution_options(yield_per=batch_size)).mappings()
+
+
+def export_favorites(writer, batch_size=1000, progress=None):
+    """Write every favorite with its owner's username; returns the row count."""
+
+    progress = progress or Progress("favorites")
+    query = (
+        select(Favorite.user_id, User.username, Favorite.book_id, Favorite.status)
+        .join(User, User.id == Favorite.user_id)
+        .order_by(Favorite.id)
+    )
+    for row in _stream(query, batch_size):
+        writer.write(dict(row))
+        progress.add(read=1)
+    progress.report()
+    return progress.counts["read"]
+
+
+def export_reviews(writer, batch_size=1000, progress=None):
+    """Write every review with its author's username; returns the row count."""
+
+    progress = progress or Progress("reviews")
+    query = (
+        select(
+            Review.user_id,
+            User.username,
+            Review.book_id,
+            Review.text,
+            Review.user_rating,
+            Review.timestamp,
+        )
+        .join(User, User.id == Review.user_id)
+        .order_by(Review.id)
+    )
+    for row in _stream(query, batch_size):
+        row = dict(row)
+        row["timestamp"] = row["timestamp"].isoformat(" ")
+        writer.write(row)
+        progress.add(read=1)
+    progress.report()
+    return progress.counts["read"]
@@ -0,0 +1,327 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+MISSING = object()
+# Result of a single-flight call whose leader gave up; waiters retry it.
+_ABANDONED = object()
+
+
+class LRUCache:
+    """Size-bounded in-process cache with a TTL per entry.
+
+    Values are shared between callers, so they must be treated as read-only.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            for key in [k for k in self._data if k[0] == namespace]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteDatabase:
+    """SQLite file shared by every worker on the host.
+
+    Each thread (and forked process) gets its own connection; WAL mode lets
+    workers read while another one writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class SQLiteStore(SQLiteDatabase):
+    """Persistent cache tier shared by every worker on the host."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, namespace, key):
+        """Return `(value, expires_at)` for a live entry, or None."""
+
+        row = (
+            self._connect()
+            .execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            )
+            .fetchone()
+        )
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace, key, value, ttl):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at)"
+            " VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def items(self, namespace):
+        """Iterate over the live `(key, value)` pairs of a namespace."""
+
+        rows = self._connect().execute(
+            "SELECT key, value FROM cache WHERE namespace = ? AND expires_at > ?",
+            (namespace, time.time()),
+        )
+        for key, value in rows:
+            yield key, json.loads(value)
+
+    def delete(self, namespace, key=None):
+        if key is None:
+            self._connect().execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+        else:
+            self._connect().execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+
+    def purge_expired(self):
+        self._connect().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def acquire(self, name, ttl):
+        """Take the lock `name` for at most `ttl` seconds; False if it is held."""
+
+        conn = self._connect()
+        now = time.time()
+        conn.execute("DELETE FROM locks WHERE name = ? AND expires_at <= ?", (name, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO locks (name, expires_at) VALUES (?, ?)", (name, now + ttl)
+        )
+        return cursor.rowcount == 1
+
+    def locked(self, name):
+        row = (
+            self._connect()
+            .execute("SELECT 1 FROM locks WHERE name = ? AND expires_at > ?", (name, time.time()))
+            .fetchone()
+        )
+        return row is not None
+
+    def release(self, name):
+        self._connect().execute("DELETE FROM locks WHERE name = ?", (name,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional persistent store.
+
+    Entries are addressed by `(namespace, key)`; each namespace has its own
+    TTL so e.g. ratings can expire sooner than author bios.
+    """
+
+    def __init__(self, memory=None, store=None, ttls=None, default_ttl=3600):
+        self.memory = memory if memory is not None else LRUCache()
+        self.store = store
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+
+    def ttl_for(self, namespace):
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def get(self, namespace, key):
+        value = self.memory.get((namespace, key))
+        if value is not MISSING or self.store is None:
+            return value
+
+        found = self.store.get(namespace, key)
+        if found is None:
+            return MISSING
+        value, expires_at = found
+        self.memory.set((namespace, key), value, expires_at - time.time())
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        ttl = self.ttl_for(namespace) if ttl is None else ttl
+        self.memory.set((namespace, key), value, ttl)
+        if self.store is not None:
+            self.store.set(namespace, key, value, ttl)
+
+    def invalidate(self, namespace, key=None):
+        """Drop one entry, or the whole namespace when `key` is None."""
+
+        if key is None:
+            self.memory.delete_namespace(namespace)
+        else:
+            self.memory.delete((namespace, key))
+        if self.store is not None:
+            self.store.delete(namespace, key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.store is not None:
+            stats["store"] = self.store.stats()
+        return stats
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one.
+
+    The first caller for a key runs the call; callers arriving while it is
+    in flight wait for and share its result or exception. Sync and async
+    callers can wait on each other's calls. A leader that is cancelled (or
+    interrupted) does not pass that on: its waiters start the call again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def _join(self, key):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _settle(self, key, future, result=None, exc=None):
+        with self._lock:
+            del self._calls[key]
+        if exc is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exc)
+
+    def do(self, key, fn):
+        """Return `fn()`, or the result of the call already in flight for `key`."""
+
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            result = future.result()
+            if result is not _ABANDONED:
+                return result
+        try:
+            result = fn()
+        except Exception as exc:
+            self._settle(key, future, exc=exc)
+            raise
+        except BaseException:
+            self._settle(key, future, _ABANDONED)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def do_async(self, key, fn):
+        """Async `do`; `fn()` returns an awaitable."""
+
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            # Shielded so that cancelling this waiter cannot cancel the call.
+            result = await asyncio.shield(asyncio.wrap_future(future))
+            if result is not _ABANDONED:
+                return result
+        try:
+            result = await fn()
+        except Exception as exc:
+            self._settle(key, future, exc=exc)
+            raise
+        except BaseException:
+            self._settle(key, future, _ABANDONED)
+            raise
+        self._settle(key, future, result)
+        return result
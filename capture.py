@@ -0,0 +1,99 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from flask import g, request, session
+
+# Query and form fields never written to a capture.
+SENSITIVE = re.compile(r"pass|secret|token|csrf|email|username|name$|image", re.IGNORECASE)
+# Endpoints whose request bodies are kept, since replaying them needs the body.
+BODY_ENDPOINTS = {"main.search_data", "main.api_books"}
+MAX_VALUE = 200
+
+
+def _clean(values):
+    return {
+        name: [value[:MAX_VALUE] for value in values.getlist(name)]
+        for name in values
+        if not SENSITIVE.search(name)
+    }
+
+
+def record(response, duration, authenticated):
+    """One capture line describing the current request."""
+
+    entry = {
+        "ts": round(time.time(), 3),
+        "method": request.method,
+        "route": request.url_rule.rule if request.url_rule else None,
+        "endpoint": request.endpoint,
+        "path": request.path,
+        "query": _clean(request.args),
+        "status": response.status_code,
+        "duration": round(duration, 6),
+        "authenticated": authenticated,
+    }
+    if request.endpoint in BODY_ENDPOINTS:
+        if request.is_json:
+            entry["json"] = request.get_json(silent=True)
+        elif request.form:
+            entry["form"] = _clean(request.form)
+    return entry
+
+
+class CaptureFile:
+    """Appends lines to `path`; each line is one write, so workers can share it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def write(self, entry):
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            # A descriptor inherited across fork would share the parent's.
+            if self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                self._pid = os.getpid()
+            os.write(self._fd, line)
+
+
+def init_app(app):
+    """Record a sample of requests to the TRAFFIC_CAPTURE file, if it is set.
+
+    Lines hold the route, path, non-sensitive parameters, status and
+    duration of a request, never cookies, headers or form secrets; replay
+    them with replay.py.
+    """
+
+    path = app.config.get("TRAFFIC_CAPTURE")
+    if not path:
+        return
+    # app.py imports this module, so its names are only read once it has loaded.
+    from app import CURR_USER_KEY
+
+    sample = app.config.get("TRAFFIC_CAPTURE_SAMPLE", 1.0)
+    out = CaptureFile(path)
+
+    @app.before_request
+    def start_capture():
+        g.capture_start = time.perf_counter()
+
+    @app.after_request
+    def capture_request(response):
+        start = g.get("capture_start")
+        if start is None or request.endpoint in ("static", "metrics"):
+            return response
+        if random.random() < sample:
+            duration = time.perf_counter() - start
+            try:
+                # The session, not g.user, so that capturing never loads the user.
+                out.write(record(response, duration, CURR_USER_KEY in session))
+            except Exception:
+                app.logger.exception("Capturing %s failed", request.path)
+        return response
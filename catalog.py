@@ -0,0 +1,113 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from fetch import first_author_key, resolve_books
+from models import db, Author, Book
+
+logger = logging.getLogger(__name__)
+
+# Stored book details older than this are refreshed from Open Library.
+BOOK_MAX_AGE = timedelta(seconds=int(os.environ.get("BOOK_METADATA_MAX_AGE", 7 * 24 * 60 * 60)))
+
+
+def description_text(book):
+    description = book.get("description")
+    if isinstance(description, dict):
+        return description.get("value")
+    return description
+
+
+def book_from_payload(key, book, author=None):
+    """Unsaved Book (with its Author) built from Open Library payloads.
+
+    Returns None if `book` is not a work payload, e.g. an upstream error.
+    """
+
+    if not book or not book.get("title"):
+        return None
+    author_key = first_author_key(book)
+    record = Book(
+        key=key,
+        title=book["title"],
+        covers=book.get("covers"),
+        subjects=book.get("subjects"),
+        description=description_text(book),
+        author_key=author_key,
+        refreshed_at=datetime.utcnow(),
+    )
+    if author_key:
+        if author and author.get("name"):
+            record.author = Author(
+                key=author_key, name=author["name"], refreshed_at=datetime.utcnow()
+            )
+        else:
+            # Keep whatever we already know rather than blanking the name.
+            record.author = db.session.get(Author, author_key) or Author(key=author_key)
+    return record
+
+
+def save_book(key, book, author=None, commit=True):
+    """Store the details of one work; returns the unsaved Book or None."""
+
+    record = book_from_payload(key, book, author)
+    if record is None:
+        return None
+    db.session.merge(record)
+    if commit:
+        _commit()
+    return record
+
+
+def _commit():
+    try:
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        logger.exception("Could not store book details")
+
+
+def remember_book(key, book, author=None):
+    """Store a work's details unless a fresh copy is already stored."""
+
+    stored = db.session.get(Book, key)
+    if stored is not None and stored.refreshed_at > datetime.utcnow() - BOOK_MAX_AGE:
+        return stored
+    return save_book(key, book, author)
+
+
+def placeholder_book(key):
+    """Book to list when Open Library cannot describe `key`."""
+
+    return Book(key=key, title=key.rsplit("/", 1)[-1])
+
+
+def store_resolved(keys, resolved):
+    """Store the output of `fetch.resolve_books(keys)`; maps each key to a Book.
+
+    Keys Open Library could not describe map to a placeholder.
+    """
+
+    books = {
+        key: save_book(key, found["book"], found["author"], commit=False)
+        for key, found in zip(keys, resolved)
+    }
+    _commit()
+    return {key: book or placeholder_book(key) for key, book in books.items()}
+
+
+def refresh_stale_books(limit=100):
+    """Re-fetch the details of up to `limit` of the stalest stored books."""
+
+    cutoff = datetime.utcnow() - BOOK_MAX_AGE
+    keys = [
+        key
+        for (key,) in db.session.query(Book.key)
+        .filter(Book.refreshed_at < cutoff)
+        .order_by(Book.refreshed_at)
+        .limit(limit)
+    ]
+    books = store_resolved(keys, resolve_books(keys))
+    return sum(book.refreshed_at is not None for book in books.values())
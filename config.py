@@ -0,0 +1,60 @@
+import os
+
+
+def _flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true")
+
+
+class Config:
+    """Settings shared by every profile, read from the environment."""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "postgresql:///books_lover")
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SECRET_KEY = os.environ.get("SECRET_KEY", "2d24980166707adcbff5305e4175c393")
+    # Seconds a book page may spend waiting on Open Library before it renders
+    # without the missing pieces.
+    BOOK_PAGE_DEADLINE = float(os.environ.get("BOOK_PAGE_DEADLINE", 8))
+    # Serve the upstream-heavy pages from async views backed by afetch.py.
+    FETCH_ASYNC = _flag("FETCH_ASYNC")
+    # Send a Server-Timing header with each response's latency breakdown.
+    METRICS_SERVER_TIMING = _flag("METRICS_SERVER_TIMING")
+    # Seconds browsers and a CDN may reuse anonymous home, book and author pages.
+    PAGE_CACHE_MAX_AGE = int(os.environ.get("PAGE_CACHE_MAX_AGE", 60))
+    # Seconds browsers and a CDN may keep a cover image.
+    COVER_MAX_AGE = int(os.environ.get("COVER_MAX_AGE", 30 * 24 * 60 * 60))
+    # Most book keys one /api/books request may look up.
+    API_BOOKS_MAX = int(os.environ.get("API_BOOKS_MAX", 50))
+    # Warm the caches behind the first N books of the home and search pages in
+    # the background; 0 turns prefetching off.
+    PREFETCH_TOP = int(os.environ.get("PREFETCH_TOP", 0))
+    # Append a sample of requests to this JSONL file for replay.py; empty is off.
+    TRAFFIC_CAPTURE = os.environ.get("TRAFFIC_CAPTURE", "")
+    TRAFFIC_CAPTURE_SAMPLE = float(os.environ.get("TRAFFIC_CAPTURE_SAMPLE", 1.0))
+    # Load Flask-DebugToolbar; only the development profile does.
+    DEBUG_TOOLBAR = False
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    DEBUG_TOOLBAR = True
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        "TEST_DATABASE_URL", "postgresql:///books_lover_tests"
+    )
+    WTF_CSRF_ENABLED = False
+
+
+class ProductionConfig(Config):
+    pass
+
+
+PROFILES = {
+    "development": DevelopmentConfig,
+    "test": TestConfig,
+    "production": ProductionConfig,
+}
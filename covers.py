@@ -0,0 +1,216 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+
+import metrics
+from fetch import OpenLibraryClient
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow covers are cached and served as fetched.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+COVERS_URL = os.environ.get("OPENLIBRARY_COVERS_URL", "https://covers.openlibrary.org")
+
+# Cover kinds and the Open Library path each is fetched from.
+KINDS = {
+    "id": ("b/id", re.compile(r"^\d+$")),
+    "olid": ("b/olid", re.compile(r"^OL\d+M$")),
+    "isbn": ("b/isbn", re.compile(r"^[\dX]{10,13}$")),
+    "author": ("a/id", re.compile(r"^\d+$")),
+}
+# Width in pixels of each size we serve; the large original is fetched once.
+SIZES = {"S": 90, "M": 240, "L": 480}
+
+
+class DiskCache:
+    """Directory of files bounded to `max_bytes`, evicting least recently used.
+
+    Reads touch a file's mtime, so the oldest mtimes are evicted first. Every
+    worker on the host can share the directory; writes are atomic renames.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(size for _, _, size in self._entries())
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def _entries(self):
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """Bytes stored under `key`, or None."""
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def set(self, key, data):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other workers write to the directory too, so re-measure it.
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+    def size(self):
+        return self._size
+
+
+def resize(data, width, fmt):
+    """`data` scaled down to `width` pixels wide and re-encoded as `fmt`."""
+
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((width, width * 3))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    if fmt == "webp":
+        image.save(out, "WEBP", quality=75, method=4)
+    else:
+        image.save(out, "JPEG", quality=80, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+class CoverStore:
+    """Fetches each cover from Open Library once and serves resized copies.
+
+    The large original is kept on disk next to the variants built from it;
+    an empty original marks a cover Open Library does not have.
+    """
+
+    def __init__(self, cache, client):
+        self.cache = cache
+        self.client = client
+
+    def _original(self, kind, value):
+        key = f"{kind}/{value}"
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        path = KINDS[kind][0]
+        with metrics.timed_upstream("covers"):
+            # default=false makes a missing cover a 404 rather than a blank image.
+            res = self.client.get(f"{path}/{value}-L.jpg", params={"default": "false"})
+        if res.status_code == 404:
+            data = b""
+        elif res.status_code == 200 and res.headers.get("Content-Type", "").startswith("image/"):
+            data = res.content
+        else:
+            logger.warning("Cover %s returned %s", key, res.status_code)
+            return None
+        self.cache.set(key, data)
+        return data
+
+    def get(self, kind, value, size, webp=False):
+        """`(bytes, mimetype)` of a cover, or None if there is none to show."""
+
+        if kind not in KINDS or size not in SIZES or not KINDS[kind][1].match(value):
+            return None
+        if Image is None:
+            data = self._original(kind, value)
+            return (data, "image/jpeg") if data else None
+
+        fmt = "webp" if webp else "jpeg"
+        key = f"{kind}/{value}-{size}.{fmt}"
+        data = self.cache.get(key)
+        if data is None:
+            original = self._original(kind, value)
+            if not original:
+                return None
+            data = resize(original, SIZES[size], fmt)
+            self.cache.set(key, data)
+        return data, f"image/{fmt}"
+
+
+def store_from_env():
+    """Build the cover store from COVER_CACHE_* environment variables."""
+
+    env = os.environ
+    directory = env.get(
+        "COVER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "books_lover_covers")
+    )
+    cache = DiskCache(directory, int(env.get("COVER_CACHE_BYTES", 256 * 1024 * 1024)))
+    client = OpenLibraryClient(
+        base_url=env.get("OPENLIBRARY_COVERS_URL", COVERS_URL),
+        pool_size=int(env.get("OPENLIBRARY_POOL_SIZE", 10)),
+        connect_timeout=float(env.get("OPENLIBRARY_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(env.get("OPENLIBRARY_READ_TIMEOUT", 10)),
+        retries=int(env.get("OPENLIBRARY_RETRIES", 2)),
+    )
+    return CoverStore(cache, client)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = store_from_env()
+    return _store
+
+
+def set_store(store):
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def _reset_after_fork():
+    global _store, _store_lock
+    _store = None
+    _store_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def cover(kind, value, size, webp=False):
+    """A cover image, or None on any failure so the caller shows a placeholder."""
+
+    try:
+        return get_store().get(kind, value, size, webp)
+    except Exception:
+        logger.exception("Could not serve cover %s/%s-%s", kind, value, size)
+        return None
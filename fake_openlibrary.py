@@ -0,0 +1,157 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class FakeOpenLibrary:
+    """Local stand-in for openlibrary.org that serves canned JSON payloads.
+
+    Routes map a request path (e.g. "/works/OL1W.json") to a payload. Tests
+    point fetch.py at `url` instead of the real API. Payloads carry an ETag
+    and a matching If-None-Match gets a 304, counted in `not_modified`.
+    Bytes payloads are served as JPEG images. Every response is held back
+    for `delay` seconds, or for the value of the longest prefix of the path
+    in `delays` (e.g. {"/search.json": 0.4}); set `status` (e.g. 503) to
+    simulate an outage.
+
+    A route may also include the query string ("/search.json?q=dune"),
+    which is preferred over the bare path. With `upstream` set, paths
+    without a route are fetched from there once and kept, so `save` can
+    record fixtures for offline runs.
+    """
+
+    def __init__(
+        self, routes=None, host="127.0.0.1", port=0, delay=0, delays=None, upstream=None
+    ):
+        self.routes = dict(routes or {})
+        self.delay = delay
+        self.delays = dict(delays or {})
+        self.upstream = upstream
+        self.status = None
+        self.requests = []
+        self.peers = set()
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @classmethod
+    def from_fixtures(cls, path, **kwargs):
+        """A fake serving the routes recorded in the JSON file at `path`."""
+
+        with open(path) as f:
+            routes = json.load(f)
+        for route, payload in routes.items():
+            if isinstance(payload, dict) and set(payload) == {"__base64__"}:
+                routes[route] = base64.b64decode(payload["__base64__"])
+        return cls(routes, **kwargs)
+
+    def save(self, path):
+        """Write the routes, including any fetched from `upstream`, to `path`."""
+
+        with self._lock:
+            routes = {
+                route: {"__base64__": base64.b64encode(payload).decode("ascii")}
+                if isinstance(payload, bytes)
+                else payload
+                for route, payload in self.routes.items()
+            }
+        with open(path, "w") as f:
+            json.dump(routes, f, indent=1, sort_keys=True)
+
+    def delay_for(self, path):
+        prefixes = [prefix for prefix in self.delays if path.startswith(prefix)]
+        if not prefixes:
+            return self.delay
+        return self.delays[max(prefixes, key=len)]
+
+    def payload_for(self, path):
+        """The payload routed to `path`, fetched from `upstream` if unknown."""
+
+        parts = urlsplit(path)
+        for route in (path, parts.path):
+            if route in self.routes:
+                return self.routes[route]
+        if self.upstream is None:
+            return None
+        try:
+            with urllib.request.urlopen(self.upstream + path, timeout=30) as res:
+                body, content_type = res.read(), res.headers.get("Content-Type", "")
+        except urllib.error.HTTPError:
+            return None
+        payload = body if content_type.startswith("image/") else json.loads(body)
+        with self._lock:
+            self.routes[path] = payload
+        return payload
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                with fake._lock:
+                    fake.requests.append(self.path)
+                    fake.peers.add(self.client_address)
+                delay = fake.delay_for(parts.path)
+                if delay:
+                    time.sleep(delay)
+                payload = fake.payload_for(self.path)
+                status = 200
+                if fake.status is not None:
+                    status, payload = fake.status, {"error": "unavailable"}
+                elif payload is None:
+                    status, payload = 404, {"error": "notfound"}
+                if isinstance(payload, bytes):
+                    body, content_type = payload, "image/jpeg"
+                else:
+                    body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    with fake._lock:
+                        fake.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if status == 200:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,49 +1,605 @@
+import contextvars
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+import metrics
+from breaker import CircuitBreaker
+from cache import MISSING, LRUCache, SingleFlight, SQLiteStore, TieredCache
 
-def get_books(subject):
-    url = f"https://openlibrary.org/{subject}.json"
-    res = requests.get(url)
-    data = res.json()
+logger = logging.getLogger(__name__)
+
+OPENLIBRARY_URL = os.environ.get("OPENLIBRARY_URL", "https://openlibrary.org")
+FETCH_WORKERS = int(os.environ.get("OPENLIBRARY_FETCH_WORKERS", 8))
+
+# Search document fields the templates use; everything else stays upstream.
+SEARCH_FIELDS = ("key", "title", "author_name", "cover_edition_key", "cover_i")
+SEARCH_LIMIT = 18
+AUTHOR_WORKS_LIMIT = 10
+
+# Seconds each kind of upstream payload stays fresh in the cache.
+CACHE_TTLS = {
+    "trending": 15 * 60,
+    "works": 6 * 60 * 60,
+    "authors": 24 * 60 * 60,
+    "ratings": 30 * 60,
+    "search": 10 * 60,
+    "author_works": 6 * 60 * 60,
+}
+# Seconds the last copy of each payload and its validators are kept after it
+# goes stale, so it can be revalidated with a conditional GET.
+VALIDATED_TTL = int(os.environ.get("OPENLIBRARY_CACHE_KEEP", 7 * 24 * 60 * 60))
+# Also coalesce identical fetches across the workers sharing the persistent
+# cache, waiting at most SHARED_FLIGHT_WAIT seconds for another worker's call.
+SHARED_FLIGHT = os.environ.get("OPENLIBRARY_SHARED_FLIGHT", "").lower() in ("1", "true")
+SHARED_FLIGHT_WAIT = float(os.environ.get("OPENLIBRARY_SHARED_FLIGHT_WAIT", 10))
+# Read timeout in seconds for each kind of upstream call. Timed out reads are
+# not retried, so this is also how long a caller can wait on the response.
+ENDPOINT_TIMEOUTS = {
+    "trending": 10,
+    "works": 5,
+    "authors": 5,
+    "ratings": 3,
+    "search": 6,
+    "author_works": 8,
+}
+# Consecutive failures that open an endpoint's circuit, and seconds it stays
+# open before a trial call.
+BREAKER_THRESHOLD = int(os.environ.get("OPENLIBRARY_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.environ.get("OPENLIBRARY_BREAKER_RESET", 30))
+
+
+class UpstreamError(Exception):
+    """Open Library could not provide a payload and no stale copy was kept."""
+
+
+class OpenLibraryClient:
+    """Keep-alive HTTP client for the Open Library API.
+
+    One instance is shared by every fetcher in the worker process. The
+    connection pool is bounded by `pool_size`; when it is exhausted callers
+    wait for a free connection instead of opening new ones.
+    """
+
+    def __init__(
+        self,
+        base_url=OPENLIBRARY_URL,
+        pool_size=10,
+        connect_timeout=3.05,
+        read_timeout=10,
+        retries=2,
+        backoff=0.3,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+
+        # A read that timed out is not retried: that would multiply the
+        # endpoint's timeout and the load on an upstream already too slow.
+        retry = Retry(
+            total=retries,
+            read=0,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, params=None, headers=None, timeout=None):
+        """GET `path` relative to the base URL; `timeout` overrides the read timeout."""
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        if timeout is not None:
+            timeout = (self.timeout[0], timeout)
+        return self.session.get(
+            url, params=params, headers=headers, timeout=timeout or self.timeout
+        )
+
+    def close(self):
+        self.session.close()
+
+
+def client_from_env():
+    """Build a client from OPENLIBRARY_* environment variables."""
+
+    env = os.environ
+    return OpenLibraryClient(
+        base_url=env.get("OPENLIBRARY_URL", OPENLIBRARY_URL),
+        pool_size=int(env.get("OPENLIBRARY_POOL_SIZE", 10)),
+        connect_timeout=float(env.get("OPENLIBRARY_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(env.get("OPENLIBRARY_READ_TIMEOUT", 10)),
+        retries=int(env.get("OPENLIBRARY_RETRIES", 2)),
+        backoff=float(env.get("OPENLIBRARY_BACKOFF", 0.3)),
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the worker's shared client, creating it on first use."""
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = client_from_env()
+    return _client
+
+
+def set_client(client):
+    """Replace the shared client, e.g. to point fetchers at a stub server."""
+
+    global _client
+    with _client_lock:
+        old, _client = _client, client
+    if old is not None and old is not client:
+        old.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the worker's bounded pool for concurrent upstream calls.
+
+    Tasks running on the pool must not submit to it and wait, or a saturated
+    pool deadlocks.
+    """
+
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=FETCH_WORKERS, thread_name_prefix="openlibrary"
+                )
+    return _executor
+
+
+def submit(fn, *args):
+    """Run `fn(*args)` on the shared pool in a copy of the caller's context.
+
+    Upstream time spent on the pool is then attributed to the request that
+    submitted it.
+    """
+
+    return get_executor().submit(contextvars.copy_context().run, fn, *args)
+
+
+def _reset_after_fork():
+    # Sockets and threads inherited from a preloading gunicorn master must
+    # not be shared.
+    global _client, _client_lock, _cache_lock, _executor, _executor_lock
+    global _flight, _counts_lock, _breakers, _breakers_lock
+    _client = None
+    _client_lock = threading.Lock()
+    _cache_lock = threading.Lock()
+    _executor = None
+    _executor_lock = threading.Lock()
+    _flight = SingleFlight()
+    _counts_lock = threading.Lock()
+    _breakers = {}
+    _breakers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def cache_from_env():
+    """Build the response cache from OPENLIBRARY_CACHE_* environment variables.
+
+    OPENLIBRARY_CACHE_DB is the path of the persistent tier; set it to an
+    empty string to keep the cache in memory only. Per-namespace TTLs can be
+    overridden with e.g. OPENLIBRARY_CACHE_TTL_RATINGS=60.
+    """
+
+    env = os.environ
+    ttls = {
+        namespace: int(env.get(f"OPENLIBRARY_CACHE_TTL_{namespace.upper()}", ttl))
+        for namespace, ttl in CACHE_TTLS.items()
+    }
+    path = env.get(
+        "OPENLIBRARY_CACHE_DB",
+        os.path.join(tempfile.gettempdir(), "books_lover_cache.sqlite3"),
+    )
+    return TieredCache(
+        memory=LRUCache(maxsize=int(env.get("OPENLIBRARY_CACHE_SIZE", 2048))),
+        store=SQLiteStore(path) if path else None,
+        ttls=ttls,
+    )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the worker's response cache, creating it on first use."""
+
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = cache_from_env()
+    return _cache
+
+
+def set_cache(cache):
+    """Replace the response cache; pass a TieredCache with no store for tests."""
+
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def invalidate(namespace, key=None):
+    """Forget cached upstream payloads, e.g. `invalidate("works", "/works/OL1W")`."""
+
+    get_cache().invalidate(namespace, key)
+
+
+def cache_stats():
+    """Hit/miss/eviction counters for each cache tier."""
+
+    return get_cache().stats()
+
+
+_flight = SingleFlight()
+_counts = {"shared_waits": 0, "stale_served": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(name):
+    with _counts_lock:
+        _counts[name] += 1
+
+
+def flight_stats():
+    """Counts of coalesced fetches, cross-worker waits and stale payloads served."""
+
+    return {"coalesced": _flight.coalesced, **_counts}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(namespace):
+    """The worker's circuit breaker for one kind of upstream call."""
+
+    breaker = _breakers.get(namespace)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(
+                namespace, CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET)
+            )
+    return breaker
+
+
+def timeout_for(namespace):
+    env = os.environ.get(f"OPENLIBRARY_TIMEOUT_{namespace.upper()}")
+    return float(env) if env else ENDPOINT_TIMEOUTS.get(namespace)
+
+
+def _cache_metrics():
+    lines = [f"openlibrary_{name}_total {value}" for name, value in flight_stats().items()]
+    for namespace, breaker in sorted(_breakers.items()):
+        lines.append(
+            f'openlibrary_breaker_open{{endpoint="{namespace}"}} {int(breaker.state == "open")}'
+        )
+        lines.append(f'openlibrary_breaker_trips_total{{endpoint="{namespace}"}} {breaker.trips}')
+    for tier, stats in cache_stats().items():
+        for name, value in stats.items():
+            suffix = "" if name == "size" else "_total"
+            lines.append(f'openlibrary_cache_{name}{suffix}{{tier="{tier}"}} {value}')
+    return lines
+
+
+metrics.registry.add_collector(_cache_metrics)
+
+_listeners = {}
+
+
+def on_payload(namespace, listener):
+    """Call `listener(key, data)` for each fresh upstream payload in `namespace`."""
+
+    _listeners.setdefault(namespace, []).append(listener)
+
+
+def _notify(namespace, key, data):
+    for listener in _listeners.get(namespace, ()):
+        try:
+            listener(key, data)
+        except Exception:
+            logger.exception("Payload listener failed for %s %s", namespace, key)
+
+
+def _validators(namespace, key):
+    """Last copy of a payload and the headers that revalidate it.
+
+    Returns `(previous, headers)`; `previous` is MISSING if there is no copy.
+    """
+
+    previous = get_cache().get("validated", f"{namespace}:{key}")
+    headers = {}
+    if previous is not MISSING:
+        if previous["etag"]:
+            headers["If-None-Match"] = previous["etag"]
+        if previous["last_modified"]:
+            headers["If-Modified-Since"] = previous["last_modified"]
+    return previous, headers
+
+
+def _remember(namespace, key, res, previous=MISSING, decode=None):
+    """Decode an upstream response, caching it if it succeeded.
+
+    A 304 Not Modified renews the `previous` copy. Only successful responses
+    are cached so upstream errors are retried. `decode(res)` defaults to
+    the JSON body, which must be an object. Server errors and bodies that
+    do not decode raise UpstreamError, so callers fall back to a kept copy.
+    """
+
+    cache = get_cache()
+    if res.status_code == 304 and previous is not MISSING:
+        cache.set(namespace, key, previous["data"])
+        cache.set("validated", f"{namespace}:{key}", previous, VALIDATED_TTL)
+        return previous["data"]
+
+    if res.status_code >= 500 or res.status_code == 429:
+        raise UpstreamError(f"Open Library {namespace} {key}: HTTP {res.status_code}")
+    try:
+        data = res.json() if decode is None else decode(res)
+    except Exception as exc:
+        raise UpstreamError(f"Open Library {namespace} {key}: invalid payload") from exc
+    if decode is None and not isinstance(data, dict):
+        raise UpstreamError(f"Open Library {namespace} {key}: payload is not an object")
+    if res.status_code == 200 and data is not None:
+        cache.set(namespace, key, data)
+        validated = {
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "data": data,
+        }
+        cache.set("validated", f"{namespace}:{key}", validated, VALIDATED_TTL)
+        _notify(namespace, key, data)
     return data
 
 
+def _get_json(namespace, key, path, params=None, decode=None):
+    """GET a JSON payload, serving it from the cache while it is fresh.
+
+    `key` identifies the payload within `namespace`. Once the cached copy
+    is stale it is revalidated, so an unchanged payload costs a 304.
+    Concurrent misses for the same payload share one upstream call.
+    """
+
+    data = get_cache().get(namespace, key)
+    if data is not MISSING:
+        return data
+    return _flight.do(
+        (namespace, key), lambda: _fetch_json(namespace, key, path, params, decode)
+    )
+
+
+def _shared_lock(namespace, key):
+    """Store whose lock on this payload we took, or None.
+
+    Returns MISSING when another worker holds the lock.
+    """
+
+    store = get_cache().store
+    if not SHARED_FLIGHT or store is None:
+        return None
+    return store if store.acquire(f"{namespace}:{key}", SHARED_FLIGHT_WAIT) else MISSING
+
+
+def _peer_result(namespace, key):
+    """Payload another worker is fetching, once it is in the shared cache."""
+
+    _count("shared_waits")
+    cache = get_cache()
+    deadline = time.monotonic() + SHARED_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        if not cache.store.locked(f"{namespace}:{key}"):
+            break
+    return cache.get(namespace, key)
+
+
+def _fetch_json(namespace, key, path, params=None, decode=None):
+    """Upstream half of `_get_json`; runs once per payload at a time."""
+
+    cache = get_cache()
+    data = cache.get(namespace, key)
+    if data is not MISSING:
+        # Another call filled the cache since the caller looked.
+        return data
+    store = _shared_lock(namespace, key)
+    if store is MISSING:
+        data = _peer_result(namespace, key)
+        if data is not MISSING:
+            return data
+        # The other worker failed or timed out; fetch it ourselves.
+        store = None
+    previous, headers = _validators(namespace, key)
+    breaker = breaker_for(namespace)
+    try:
+        if not breaker.allow():
+            return _stale(namespace, key, previous, "circuit open")
+        succeeded = False
+        try:
+            with metrics.timed_upstream(namespace):
+                res = get_client().get(
+                    path, params=params, headers=headers, timeout=timeout_for(namespace)
+                )
+            data = _remember(namespace, key, res, previous, decode)
+            succeeded = True
+        except (requests.RequestException, UpstreamError) as exc:
+            return _stale(namespace, key, previous, exc)
+        finally:
+            # Settled whatever was raised, e.g. by `decode`, so that a
+            # half-open breaker's trial call always ends.
+            if succeeded:
+                breaker.success()
+            else:
+                breaker.failure()
+        return data
+    finally:
+        if store is not None:
+            store.release(f"{namespace}:{key}")
+
+
+def _stale(namespace, key, previous, reason):
+    """Last good copy of a payload Open Library failed to provide.
+
+    Raises UpstreamError if no copy was kept.
+    """
+
+    if previous is MISSING:
+        raise UpstreamError(f"Open Library {namespace} {key} unavailable: {reason}") from (
+            reason if isinstance(reason, Exception) else None
+        )
+    _count("stale_served")
+    logger.warning("Serving stale %s %s: %s", namespace, key, reason)
+    return previous["data"]
+
+
+def books_namespace(subject):
+    return "trending" if subject.strip("/").startswith("trending") else "works"
+
+
+def get_books(subject):
+    return _get_json(books_namespace(subject), subject, f"{subject}.json")
+
+
 def get_authors_details(key):
-    url = f"https://openlibrary.org/{key}.json"
-    res = requests.get(url)
-    data = res.json()
-    return data
+    return _get_json("authors", key, f"{key}.json")
 
 
 def get_ratings_details(key):
-    url = f"https://openlibrary.org/{key}/ratings.json"
-    res = requests.get(url)
-    data = res.json()
-    return data
+    return _get_json("ratings", key, f"{key}/ratings.json")
 
 
-def search(q):
-    url = f"https://openlibrary.org/search.json?q={q}"
-    response = requests.get(url)
+def _search_docs(response):
+    """Documents from a search response, or None if the search failed."""
 
-    if response.status_code == 200:
-        try:
-            data = response.json()
-            # Access the list of documents
-            docs = data.get("docs", [])
-            return docs
-        except Exception as e:
-            print(f"Error parsing JSON response: {e}")
-            return []
-    else:
-        # Handle the API error here and print response content
-        print(f"API Error: {response.status_code}")
-        print(response.text)
+    if response.status_code != 200:
+        logger.warning("Search failed: HTTP %s", response.status_code)
+        return None
+    try:
+        return response.json().get("docs", [])
+    except Exception as e:
+        logger.warning("Search response could not be decoded: %s", e)
+        return None
+
+
+def search_params(q, limit=SEARCH_LIMIT, offset=0, fields=SEARCH_FIELDS):
+    """Query string for search.json with the page and projection pushed down."""
+
+    params = {"q": q, "limit": limit, "offset": offset}
+    if fields:
+        params["fields"] = ",".join(fields)
+    return params
+
+
+def search(q, limit=SEARCH_LIMIT, offset=0, fields=SEARCH_FIELDS):
+    """Search works, returning at most `limit` docs starting at `offset`.
+
+    Only `fields` are requested, so Open Library never sends (and we never
+    parse) documents or attributes the caller would throw away.
+    """
+
+    params = search_params(q, limit, offset, fields)
+    try:
+        docs = _get_json("search", urlencode(params), "search.json", params, _search_docs)
+    except UpstreamError:
+        logger.warning("Search for %r failed", q, exc_info=True)
         return []
+    return [] if docs is None else docs
 
 
-def author_works(key):
-    url = f"https://openlibrary.org/{key}/works.json"
-    res = requests.get(url)
-    data = res.json()
-    return data
+def _works_page(response):
+    """An author works page cut down to the total and each work's key and title."""
+
+    data = response.json()
+    return {
+        "size": data.get("size"),
+        "entries": [
+            {"key": work.get("key"), "title": work.get("title")}
+            for work in data.get("entries") or []
+        ],
+    }
+
+
+def author_works(key, limit=AUTHOR_WORKS_LIMIT, offset=0):
+    """`limit` of an author's works from `offset`, as `{"size": total, "entries": [...]}`.
+
+    The page is requested from Open Library rather than sliced from the
+    full list, and each page is cached on its own.
+    """
+
+    params = {"limit": limit, "offset": offset}
+    return _get_json(
+        "author_works", f"{key}?{urlencode(params)}", f"{key}/works.json", params, _works_page
+    )
+
+
+def first_author_key(book):
+    """Key of the first listed author of a work payload, or None."""
+
+    try:
+        return book["authors"][0]["author"]["key"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _lookup(fetcher, key):
+    try:
+        return fetcher(key)
+    except Exception:
+        logger.exception("Open Library lookup failed for %s", key)
+        return None
+
+
+def _lookup_all(fetcher, keys):
+    futures = [submit(_lookup, fetcher, key) for key in keys]
+    return {key: future.result() for key, future in zip(keys, futures)}
+
+
+def resolve_books(keys, with_authors=True):
+    """Fetch the works for `keys` and their first authors concurrently.
+
+    Duplicate book and author keys are fetched once. Returns one
+    `{"book": ..., "author": ...}` dict per key, in the order given; a failed
+    lookup leaves its value as None instead of raising. Authors are left as
+    None without being fetched unless `with_authors`.
+    """
+
+    book_keys = [*dict.fromkeys(keys)]
+    books = _lookup_all(get_books, book_keys)
+    author_keys = [*dict.fromkeys(filter(None, map(first_author_key, books.values())))]
+    authors = _lookup_all(get_authors_details, author_keys) if with_authors else {}
+
+    return [
+        {"book": books[key], "author": authors.get(first_author_key(books[key]))}
+        for key in keys
+    ]
@@ -30,16 +30,15 @@ class ReviewForm(FlaskForm):
     text = TextAreaField("Comment", validators=[DataRequired()])
 
 
+FAVORITE_STATUSES = ("want to read", "currently reading", "read")
+
+
 class FavoriteForm(FlaskForm):
     """Form for adding favorite books to users private page-list."""
 
     status = SelectField(
         "Status",
-        choices=[
-            ("want to read", "want to read"),
-            ("currently reading", "currently reading"),
-            ("read", "read"),
-        ],
+        choices=[(status, status) for status in FAVORITE_STATUSES],
     )
 
 
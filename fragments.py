@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+from flask import current_app, request
+from markupsafe import Markup
+
+import fetch
+import metrics
+from cache import LRUCache, MISSING
+
+# Rendered fragments are a few kilobytes each, so the entry count bounds memory.
+cache = LRUCache(int(os.environ.get("FRAGMENT_CACHE_SIZE", 4096)))
+TTL = int(os.environ.get("FRAGMENT_CACHE_TTL", 24 * 60 * 60))
+
+_versions = {}
+
+
+def _namespace(key):
+    # Route keys lack the leading slash that Open Library keys carry.
+    return "/" + str(key).lstrip("/")
+
+
+def _template(name):
+    """The fragment template and a hash of its source.
+
+    Jinja hands back a new template object when the file changes, so the
+    source is only hashed again after a reload.
+    """
+
+    env = current_app.jinja_env
+    template = env.get_template(f"fragments/{name}.html")
+    known = _versions.get(name)
+    if known is None or known[0] is not template:
+        source = env.loader.get_source(env, template.name)[0]
+        known = (template, hashlib.sha1(source.encode("utf-8")).hexdigest()[:12])
+        _versions[name] = known
+    return known
+
+
+def fragment(name, key, **payload):
+    """Render `fragments/<name>.html` for book `key`, reusing a cached copy.
+
+    The template sees `key` and the payload's keyword arguments, never the
+    user or session, so one copy serves every visitor. A change to the
+    payload or the template renders a new copy.
+    """
+
+    template, version = _template(name)
+    digest = hashlib.sha1(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    cache_key = (_namespace(key), name, version, request.script_root, digest)
+    html = cache.get(cache_key)
+    if html is MISSING:
+        html = Markup(template.render(payload, key=key))
+        cache.set(cache_key, html, TTL)
+    return html
+
+
+def invalidate(key):
+    """Drop every fragment rendered for book `key`."""
+
+    cache.delete_namespace(_namespace(key))
+
+
+def init_app(app):
+    app.add_template_global(fragment)
+
+
+def _drop_changed_work(key, data):
+    # Stale copies are never served, as the payload hash changes; this frees them early.
+    invalidate(key)
+
+
+def _fragment_metrics():
+    return [
+        f"fragment_cache_{name}{'' if name == 'size' else '_total'} {value}"
+        for name, value in cache.stats().items()
+    ]
+
+
+fetch.on_payload("works", _drop_changed_work)
+metrics.registry.add_collector(_fragment_metrics)
@@ -0,0 +1,36 @@
+import os
+from collections import namedtuple
+
+from cache import MISSING, LRUCache
+from models import db, User
+
+# The user columns requests need; the password hash is never loaded.
+Identity = namedtuple("Identity", ["id", "username", "image_url"])
+
+IDENTITY_TTL = int(os.environ.get("IDENTITY_CACHE_TTL", 60))
+
+_identities = LRUCache(maxsize=int(os.environ.get("IDENTITY_CACHE_SIZE", 4096)))
+
+
+def load_identity(user_id):
+    """Identity of a user, served from a short-lived per-worker cache.
+
+    Returns None if the user does not exist.
+    """
+
+    identity = _identities.get(user_id)
+    if identity is MISSING:
+        row = (
+            db.session.query(User.id, User.username, User.image_url)
+            .filter(User.id == user_id)
+            .first()
+        )
+        identity = Identity(*row) if row else None
+        _identities.set(user_id, identity, IDENTITY_TTL)
+    return identity
+
+
+def forget_identity(user_id):
+    """Drop a cached identity, e.g. after logout or a profile change."""
+
+    _identities.delete(user_id)
@@ -0,0 +1,226 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, before_render_template, g, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative histogram in the Prometheus exposition model."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms by metric name and label values, shared by a worker."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, help, buckets=DURATION_BUCKETS):
+        self._help[name] = (help, buckets)
+
+    def add_collector(self, collector):
+        """Append `collector()`'s exposition lines to every scrape."""
+
+        self._collectors.append(collector)
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._metrics.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._help[name][1])
+            histogram.observe(value)
+
+    def render(self):
+        """Prometheus text exposition of every histogram."""
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._metrics.items()):
+                lines.append(f"# HELP {name} {self._help[name][0]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    labels = [f'{k}="{_escape(v)}"' for k, v in key]
+                    cumulative = 0
+                    for bound, count in zip(
+                        (*histogram.buckets, "+Inf"), histogram.counts
+                    ):
+                        cumulative += count
+                        le = ",".join([*labels, f'le="{bound}"'])
+                        lines.append(f"{name}_bucket{{{le}}} {cumulative}")
+                    joined = "{" + ",".join(labels) + "}" if labels else ""
+                    lines.append(f"{name}_sum{joined} {histogram.sum}")
+                    lines.append(f"{name}_count{joined} {histogram.count}")
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+registry.describe("http_request_duration_seconds", "Wall time per request.")
+registry.describe(
+    "upstream_request_duration_seconds",
+    "Wall time per request spent waiting on Open Library, per endpoint.",
+)
+registry.describe("sql_query_duration_seconds", "Wall time per request spent in SQL.")
+registry.describe("sql_queries_per_request", "SQL statements per request.", COUNT_BUCKETS)
+registry.describe(
+    "template_render_duration_seconds", "Wall time per request spent rendering templates."
+)
+
+
+class RequestTimings:
+    """Where one request spent its time.
+
+    Upstream calls may be made from pool threads, so updates are locked.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.upstream = {}
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.render_start = None
+        self._lock = threading.Lock()
+
+    def add_upstream(self, endpoint, seconds):
+        with self._lock:
+            self.upstream[endpoint] = self.upstream.get(endpoint, 0.0) + seconds
+
+    def add_sql(self, seconds):
+        with self._lock:
+            self.sql_count += 1
+            self.sql_time += seconds
+
+    def add_render(self, seconds):
+        with self._lock:
+            self.render_time += seconds
+
+
+current = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed_upstream(endpoint):
+    """Attribute the enclosed Open Library call to the current request."""
+
+    timings = current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add_upstream(endpoint, time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info["query_start"].pop()
+    timings = current.get()
+    if timings is not None:
+        timings.add_sql(time.perf_counter() - start)
+
+
+event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_render_template(app, template, context):
+    timings = current.get()
+    if timings is not None:
+        timings.render_start = time.perf_counter()
+
+
+def _template_rendered(app, template, context):
+    timings = current.get()
+    if timings is not None and timings.render_start is not None:
+        timings.add_render(time.perf_counter() - timings.render_start)
+        timings.render_start = None
+
+
+def server_timing(timings, total):
+    """Server-Timing header value for a finished request."""
+
+    parts = [
+        f'upstream-{endpoint};dur={seconds * 1000:.1f}'
+        for endpoint, seconds in sorted(timings.upstream.items())
+    ]
+    parts.append(f'sql;dur={timings.sql_time * 1000:.1f};desc="{timings.sql_count} queries"')
+    parts.append(f"render;dur={timings.render_time * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def init_app(app):
+    """Record request timings for `app` and serve them at /metrics.
+
+    Set METRICS_SERVER_TIMING to also send a Server-Timing header. Histograms
+    are kept per worker process.
+    """
+
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+    @app.before_request
+    def start_timings():
+        g.timings_token = current.set(RequestTimings())
+
+    @app.after_request
+    def record_timings(response):
+        timings = current.get()
+        if timings is None or request.endpoint == "metrics":
+            return response
+        total = time.perf_counter() - timings.start
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        registry.observe("http_request_duration_seconds", total, route=route)
+        for endpoint, seconds in timings.upstream.items():
+            registry.observe(
+                "upstream_request_duration_seconds", seconds, route=route, endpoint=endpoint
+            )
+        registry.observe("sql_queries_per_request", timings.sql_count, route=route)
+        registry.observe("sql_query_duration_seconds", timings.sql_time, route=route)
+        registry.observe("template_render_duration_seconds", timings.render_time, route=route)
+        if app.config.get("METRICS_SERVER_TIMING"):
+            response.headers["Server-Timing"] = server_timing(timings, total)
+        return response
+
+    @app.teardown_request
+    def clear_timings(exc):
+        token = g.pop("timings_token", None)
+        if token is not None:
+            current.reset(token)
+
+    @app.route("/metrics")
+    def metrics():
+        """Prometheus metrics for this worker."""
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+from models import db
+
+# Idempotent upgrades for databases created before a model change.
+# db.create_all() only adds missing tables, so changes to existing tables
+# are listed here in order and applied by `flask upgrade-db`.
+MIGRATIONS = [
+    (
+        "Remove duplicate favorites, keeping the oldest row",
+        "DELETE FROM favorites WHERE id NOT IN"
+        " (SELECT MIN(id) FROM favorites GROUP BY user_id, book_id)",
+    ),
+    (
+        "Unique index on favorites (user_id, book_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS favorites_user_book_key"
+        " ON favorites (user_id, book_id)",
+    ),
+    (
+        "Index on favorites (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS favorites_user_id_id ON favorites (user_id, id)",
+    ),
+    (
+        "Index on comments (book_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS comments_book_id_timestamp"
+        " ON comments (book_id, timestamp)",
+    ),
+    ("Clear review aggregates", "DELETE FROM book_ratings"),
+    (
+        "Recompute review aggregates",
+        "INSERT INTO book_ratings (book_id, review_count, rating_sum)"
+        " SELECT book_id, COUNT(*), COALESCE(SUM(user_rating), 0)"
+        " FROM comments GROUP BY book_id",
+    ),
+]
+
+
+def upgrade(log=print):
+    """Apply every migration in one transaction; safe to run repeatedly."""
+
+    for description, statement in MIGRATIONS:
+        log(description)
+        db.session.execute(text(statement))
+    db.session.commit()
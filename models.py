@@ -1,9 +1,11 @@
 from datetime import datetime
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+from passwords import check_password, hash_password, needs_rehash
 
-bcrypt = Bcrypt()
 db = SQLAlchemy()
 
 
@@ -26,7 +28,7 @@ class User(db.Model):
     def signup(cls, username, email, password, image_url, first_name, last_name):
         """Sign up user."""
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode("UTF-8")
+        hashed_pwd = hash_password(password)
 
         user = User(
             username=username,
@@ -42,28 +44,71 @@ class User(db.Model):
 
     @classmethod
     def authenticate(cls, username, password):
-        """Find user with `username` and `password`."""
+        """Find user with `username` and `password`.
+
+        A hash made with an outdated cost is replaced; the caller commits.
+        """
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            is_auth = check_password(user.password, password)
             if is_auth:
+                if needs_rehash(user.password):
+                    user.password = hash_password(password)
                 return user
 
         return False
 
 
+class Author(db.Model):
+    """Open Library author details kept for rendering book lists."""
+
+    __tablename__ = "authors"
+
+    key = db.Column(db.String, primary_key=True)
+    name = db.Column(db.Text)
+    refreshed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Author {self.key}: {self.name}>"
+
+
+class Book(db.Model):
+    """Open Library work details kept for rendering book lists."""
+
+    __tablename__ = "books"
+
+    key = db.Column(db.String, primary_key=True)
+    title = db.Column(db.Text, nullable=False)
+    covers = db.Column(db.JSON)
+    subjects = db.Column(db.JSON)
+    description = db.Column(db.Text)
+    author_key = db.Column(db.String, db.ForeignKey("authors.key"))
+    refreshed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    author = db.relationship("Author")
+
+    def __repr__(self):
+        return f"<Book {self.key}: {self.title}>"
+
+
 class Favorite(db.Model):
     """User's favorite books"""
 
     __tablename__ = "favorites"
+    __table_args__ = (
+        db.Index("favorites_user_book_key", "user_id", "book_id", unique=True),
+        db.Index("favorites_user_id_id", "user_id", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.String)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="cascade"))
     book_id = db.Column(db.String, nullable=False)
     user = db.relationship("User", backref="favorites")
+    book = db.relationship(
+        "Book", primaryjoin="foreign(Favorite.book_id) == Book.key", viewonly=True
+    )
 
     def __repr__(self):
         return f"<Favorite #{self.id}: {self.user_id}, {self.book_id}, {self.status}>"
@@ -73,14 +118,91 @@ class Review(db.Model):
     """User's comments"""
 
     __tablename__ = "comments"
+    __table_args__ = (db.Index("comments_book_id_timestamp", "book_id", "timestamp"),)
 
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(240), nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow())
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"))
-    book_id = db.Column(db.String, nullable=False)
-    user_rating = db.Column(db.Integer)
+    # active_history loads the old value on change, even on an expired
+    # instance, so the rating listeners can take it back out.
+    book_id = db.column_property(db.Column(db.String, nullable=False), active_history=True)
+    user_rating = db.column_property(db.Column(db.Integer), active_history=True)
     user = db.relationship("User")
+    book = db.relationship(
+        "Book", primaryjoin="foreign(Review.book_id) == Book.key", viewonly=True
+    )
+
+
+class BookRating(db.Model):
+    """Running count and sum of review ratings per book.
+
+    Kept up to date by the Review mapper events below, so pages can show the
+    community rating without scanning reviews. Bulk query deletes bypass the
+    events; `flask upgrade-db` recomputes the table from scratch.
+    """
+
+    __tablename__ = "book_ratings"
+
+    book_id = db.Column(db.String, primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+
+    @property
+    def average(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+
+def _adjust_rating(connection, book_id, count, total):
+    if not count and not total:
+        return
+    table = BookRating.__table__
+    values = {"book_id": book_id, "review_count": count, "rating_sum": total}
+    increment = {
+        "review_count": table.c.review_count + count,
+        "rating_sum": table.c.rating_sum + total,
+    }
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    if connection.dialect.name in dialects:
+        stmt = dialects[connection.dialect.name].insert(table).values(**values)
+        connection.execute(
+            stmt.on_conflict_do_update(index_elements=["book_id"], set_=increment)
+        )
+        return
+    updated = connection.execute(
+        table.update().where(table.c.book_id == book_id).values(**increment)
+    )
+    if not updated.rowcount:
+        connection.execute(table.insert().values(**values))
+
+
+def _rating(value):
+    return int(value) if value else 0
+
+
+@event.listens_for(Review, "after_insert")
+def _count_new_review(mapper, connection, review):
+    _adjust_rating(connection, review.book_id, 1, _rating(review.user_rating))
+
+
+@event.listens_for(Review, "after_update")
+def _count_edited_review(mapper, connection, review):
+    state = inspect(review)
+    rating = state.attrs.user_rating.history
+    book = state.attrs.book_id.history
+    if not rating.has_changes() and not book.has_changes():
+        return
+    old_rating = _rating(rating.deleted[0] if rating.deleted else review.user_rating)
+    old_book = book.deleted[0] if book.deleted else review.book_id
+    _adjust_rating(connection, old_book, -1, -old_rating)
+    _adjust_rating(connection, review.book_id, 1, _rating(review.user_rating))
+
+
+@event.listens_for(Review, "after_delete")
+def _count_deleted_review(mapper, connection, review):
+    _adjust_rating(connection, review.book_id, -1, -_rating(review.user_rating))
 
 
 def connect_db(app):
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+# bcrypt cost (log2 of the number of rounds) for new hashes.
+BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+# Processes per worker that hash passwords; 0 hashes in the calling thread.
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+
+HASH_PREFIX = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(hashed, password):
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+class HashPool:
+    """Bounded process pool for bcrypt work.
+
+    bcrypt is deliberately slow CPU work. Running it in `workers` separate
+    processes caps how much CPU a login spike can take from the rest of the
+    site. At most `workers * 4` calls are queued; further callers wait for a
+    slot instead of growing the backlog.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(workers, 1) * 4)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._slots:
+            return self._get_executor().submit(fn, *args).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_pool = HashPool()
+
+
+def set_pool(pool):
+    global _pool
+    old, _pool = _pool, pool
+    old.shutdown()
+
+
+def _reset_after_fork():
+    # The parent's pool processes belong to the parent.
+    global _pool
+    _pool = HashPool(_pool.workers)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def hash_password(password, rounds=None):
+    """bcrypt hash of `password` at `rounds` (default BCRYPT_LOG_ROUNDS)."""
+
+    return _pool.run(_hash, password, rounds or BCRYPT_LOG_ROUNDS)
+
+
+def check_password(hashed, password):
+    """Whether `password` matches the bcrypt hash `hashed`."""
+
+    return _pool.run(_check, hashed, password)
+
+
+def hash_rounds(hashed):
+    """Cost a bcrypt hash was made with, or None if it is not one."""
+
+    match = HASH_PREFIX.match(hashed or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed, rounds=None):
+    """Whether `hashed` was made with a different cost than configured."""
+
+    return hash_rounds(hashed) != (rounds or BCRYPT_LOG_ROUNDS)
@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from cache import MISSING
+from fetch import (
+    books_namespace,
+    first_author_key,
+    get_authors_details,
+    get_books,
+    get_cache,
+    get_ratings_details,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upstream requests per second the prefetcher may make, per worker process.
+PREFETCH_RATE = float(os.environ.get("PREFETCH_RATE", 2))
+PREFETCH_BURST = int(os.environ.get("PREFETCH_BURST", 6))
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", 2))
+# Books waiting to be warmed; more are dropped rather than queued.
+PREFETCH_QUEUE = int(os.environ.get("PREFETCH_QUEUE", 100))
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _wait_time(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """Take a token, waiting up to `timeout` seconds; False if none came."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                wait = self._wait_time()
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def _cached_or_fetch(bucket, namespace, key, fetcher):
+    # Only upstream calls spend tokens; cached payloads are free.
+    data = get_cache().get(namespace, key)
+    if data is not MISSING:
+        return data
+    bucket.acquire()
+    return fetcher(key)
+
+
+def warm_book(key, bucket):
+    """Load a book page's work, author and ratings into the cache."""
+
+    key = key.lstrip("/")
+    book = _cached_or_fetch(bucket, books_namespace(key), key, get_books)
+    author_key = first_author_key(book)
+    if author_key:
+        _cached_or_fetch(bucket, "authors", author_key, get_authors_details)
+    _cached_or_fetch(bucket, "ratings", key, get_ratings_details)
+
+
+class Prefetcher:
+    """Warms book pages on a few background threads, rate limited upstream.
+
+    `warm` never blocks: keys already waiting are ignored and keys beyond
+    `max_pending` are dropped.
+    """
+
+    def __init__(self, workers, rate, burst, max_pending):
+        self.workers = workers
+        self.bucket = TokenBucket(rate, burst)
+        self.max_pending = max_pending
+        self.counts = {"queued": 0, "dropped": 0, "warmed": 0, "failed": 0}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # Threads do not survive fork, so each worker starts its own pool.
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="prefetch"
+            )
+            self._pending = set()
+            self._pid = os.getpid()
+        return self._executor
+
+    def warm(self, keys):
+        """Queue `keys` to be warmed; returns the futures of the queued ones."""
+
+        futures = []
+        with self._lock:
+            executor = self._get_executor()
+            for key in keys:
+                if key in self._pending:
+                    continue
+                if len(self._pending) >= self.max_pending:
+                    self.counts["dropped"] += 1
+                    continue
+                self._pending.add(key)
+                self.counts["queued"] += 1
+                futures.append(executor.submit(self._warm, key))
+        return futures
+
+    def _warm(self, key):
+        try:
+            warm_book(key, self.bucket)
+        except Exception as e:
+            self._count("failed")
+            logger.warning("Prefetching %s failed: %s", key, e)
+        else:
+            self._count("warmed")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+
+prefetcher = Prefetcher(PREFETCH_WORKERS, PREFETCH_RATE, PREFETCH_BURST, PREFETCH_QUEUE)
+
+
+def warm(keys):
+    """Warm the book pages of `keys` in the background."""
+
+    return prefetcher.warm(keys)
+
+
+def _prefetch_metrics():
+    return [f"prefetch_{name}_total {value}" for name, value in prefetcher.counts.items()]
+
+
+metrics.registry.add_collector(_prefetch_metrics)
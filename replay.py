@@ -0,0 +1,218 @@
+"""Replay captured traffic and report latency and throughput per route.
+
+    python replay.py traffic.jsonl --concurrency 8 --fixtures fixtures/openlibrary.json
+
+Requests captured with TRAFFIC_CAPTURE run in this process through the
+Flask test client, with Open Library replaced by a local fake serving the
+fixtures after `--latency` seconds (or a `--route-latency` per path prefix),
+so runs need no network. Pass `--url` to drive a running server instead.
+Requests captured from logged in users are skipped unless `--user-id` names
+a user to replay them as. `--record` keeps the fake's fixtures, fetching
+paths it lacks from openlibrary.org. The app's database and caches live in
+a temporary directory for the run.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_openlibrary import FakeOpenLibrary
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty sorted list."""
+
+    return values[min(len(values) - 1, max(math.ceil(p / 100 * len(values)) - 1, 0))]
+
+
+def read_traffic(path, user_id=None, live=False):
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return [
+        entry
+        for entry in entries
+        if not entry.get("authenticated") or (user_id is not None and not live)
+    ]
+
+
+class AppClient:
+    """Sends entries to the app in this process, one test client per thread."""
+
+    def __init__(self, app, user_id=None):
+        self.app = app
+        self.user_id = user_id
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            from app import CURR_USER_KEY
+
+            client = self._local.client = self.app.test_client()
+            if self.user_id is not None:
+                with client.session_transaction() as session:
+                    session[CURR_USER_KEY] = self.user_id
+        return client
+
+    def send(self, entry):
+        response = self._client().open(
+            entry["path"],
+            method=entry["method"],
+            query_string=entry.get("query"),
+            json=entry.get("json"),
+            data=entry.get("form"),
+        )
+        response.close()
+        return response.status_code
+
+
+class HTTPClient:
+    """Sends entries to a running server, one connection pool per thread."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self._local = threading.local()
+
+    def send(self, entry):
+        import requests
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.request(
+            entry["method"],
+            self.url + entry["path"],
+            params=entry.get("query"),
+            json=entry.get("json"),
+            data=entry.get("form"),
+            allow_redirects=False,
+        )
+        return response.status_code
+
+
+def replay(client, entries, concurrency):
+    """Send every entry; returns `{route: [(seconds, status), ...]}` and the wall time."""
+
+    results = defaultdict(list)
+    lock = threading.Lock()
+
+    def send(entry):
+        start = time.perf_counter()
+        try:
+            status = client.send(entry)
+        except Exception:
+            status = None
+        elapsed = time.perf_counter() - start
+        with lock:
+            results[entry.get("route") or entry["path"]].append((elapsed, status))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, entries))
+    return results, time.perf_counter() - start
+
+
+def report(results, wall):
+    print(
+        f"{'route':<40} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'req/s':>8}"
+    )
+    rows = sorted(results.items()) + [("total", [r for rs in results.values() for r in rs])]
+    for route, samples in rows:
+        times = sorted(elapsed for elapsed, _ in samples)
+        errors = sum(status is None or status >= 500 for _, status in samples)
+        print(
+            f"{route[:40]:<40} {len(samples):>6} {errors:>6} "
+            f"{percentile(times, 50) * 1000:>8.1f} {percentile(times, 95) * 1000:>8.1f} "
+            f"{percentile(times, 99) * 1000:>8.1f} {len(samples) / wall:>8.1f}"
+        )
+
+
+def route_latency(value):
+    prefix, _, seconds = value.rpartition("=")
+    return prefix, float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("traffic", help="JSONL file written by TRAFFIC_CAPTURE")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the traffic.")
+    parser.add_argument("--url", help="Replay against a running server.")
+    parser.add_argument("--user-id", type=int, help="Replay logged in requests as this user.")
+    parser.add_argument("--fixtures", help="JSON file of Open Library payloads to serve.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per upstream call.")
+    parser.add_argument(
+        "--route-latency",
+        type=route_latency,
+        action="append",
+        default=[],
+        metavar="PREFIX=SECONDS",
+        help="Upstream latency for paths starting with PREFIX, e.g. /search.json=0.4",
+    )
+    parser.add_argument("--record", action="store_true", help="Save fetched fixtures back.")
+    args = parser.parse_args()
+
+    entries = read_traffic(args.traffic, args.user_id, live=bool(args.url)) * args.repeat
+    if not entries:
+        parser.error("no requests to replay")
+
+    if args.url:
+        results, wall = replay(HTTPClient(args.url), entries, args.concurrency)
+        report(results, wall)
+        return
+
+    options = {
+        "delay": args.latency,
+        "delays": dict(args.route_latency),
+        "upstream": "https://openlibrary.org" if args.record else None,
+    }
+    if args.fixtures and os.path.exists(args.fixtures):
+        fake = FakeOpenLibrary.from_fixtures(args.fixtures, **options)
+    else:
+        fake = FakeOpenLibrary(**options)
+    fake.start()
+    # Everything the app stores goes to a throwaway directory, never to the
+    # database and caches of a real deployment. fetch.py reads the URLs when
+    # imported, the caches when first used.
+    scratch = tempfile.mkdtemp(prefix="replay-")
+    os.environ.update(
+        {
+            "OPENLIBRARY_URL": fake.url,
+            "OPENLIBRARY_COVERS_URL": fake.url,
+            "OPENLIBRARY_CACHE_DB": os.path.join(scratch, "cache.sqlite3"),
+            "SEARCH_INDEX_DB": os.path.join(scratch, "search.sqlite3"),
+            "COVER_CACHE_DIR": os.path.join(scratch, "covers"),
+        }
+    )
+    from app import create_app
+    from models import db
+
+    app = create_app(
+        {
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(scratch, 'app.sqlite3')}",
+            "TRAFFIC_CAPTURE": "",
+        }
+    )
+    with app.app_context():
+        db.create_all()
+    try:
+        results, wall = replay(AppClient(app, args.user_id), entries, args.concurrency)
+    finally:
+        fake.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+        if args.record and args.fixtures:
+            fake.save(args.fixtures)
+    report(results, wall)
+    print(f"{len(fake.requests)} Open Library requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+
+import fetch
+from cache import SQLiteDatabase
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS works (
+    key TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author_key TEXT,
+    author_name TEXT,
+    subjects TEXT,
+    cover_i INTEGER,
+    cover_edition_key TEXT
+);
+CREATE INDEX IF NOT EXISTS works_author_key ON works (author_key);
+CREATE TABLE IF NOT EXISTS authors (key TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5(
+    title, author_name, subjects, content='works', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS works_ai AFTER INSERT ON works BEGIN
+    INSERT INTO works_fts (rowid, title, author_name, subjects)
+    VALUES (new.rowid, new.title, new.author_name, new.subjects);
+END;
+CREATE TRIGGER IF NOT EXISTS works_ad AFTER DELETE ON works BEGIN
+    INSERT INTO works_fts (works_fts, rowid, title, author_name, subjects)
+    VALUES ('delete', old.rowid, old.title, old.author_name, old.subjects);
+END;
+CREATE TRIGGER IF NOT EXISTS works_au AFTER UPDATE ON works BEGIN
+    INSERT INTO works_fts (works_fts, rowid, title, author_name, subjects)
+    VALUES ('delete', old.rowid, old.title, old.author_name, old.subjects);
+    INSERT INTO works_fts (rowid, title, author_name, subjects)
+    VALUES (new.rowid, new.title, new.author_name, new.subjects);
+END;
+"""
+
+UPSERT_WORK = """
+INSERT INTO works (key, title, author_key, author_name, subjects, cover_i, cover_edition_key)
+VALUES (:key, :title, :author_key,
+        COALESCE(:author_name, (SELECT name FROM authors WHERE key = :author_key)),
+        :subjects, :cover_i, :cover_edition_key)
+ON CONFLICT (key) DO UPDATE SET
+    title = excluded.title,
+    author_key = COALESCE(excluded.author_key, works.author_key),
+    author_name = COALESCE(excluded.author_name, works.author_name),
+    subjects = COALESCE(excluded.subjects, works.subjects),
+    cover_i = COALESCE(excluded.cover_i, works.cover_i),
+    cover_edition_key = COALESCE(excluded.cover_edition_key, works.cover_edition_key)
+"""
+
+
+def match_expression(q):
+    """FTS5 query matching every word of `q` as a prefix, or None."""
+
+    words = re.findall(r"\w+", q or "")
+    return " ".join(f'"{word}"*' for word in words) or None
+
+
+class SearchIndex(SQLiteDatabase):
+    """Full-text index over the works the site has already seen.
+
+    Rows are merged from work payloads, author payloads and upstream search
+    documents, and come back in the same shape as `fetch.search` docs.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._connect().executescript(SCHEMA)
+
+    def add_work(self, key, data):
+        # Route keys lack the leading slash; the payload's own key has it.
+        key = data.get("key") or key
+        if not key.startswith("/works/") or not data.get("title"):
+            return
+        covers = [c for c in data.get("covers") or () if c and c > 0]
+        subjects = data.get("subjects") or ()
+        self._connect().execute(
+            UPSERT_WORK,
+            {
+                "key": key,
+                "title": data["title"],
+                "author_key": fetch.first_author_key(data),
+                "author_name": None,
+                "subjects": ", ".join(s for s in subjects if isinstance(s, str)) or None,
+                "cover_i": covers[0] if covers else None,
+                "cover_edition_key": None,
+            },
+        )
+
+    def add_author(self, key, data):
+        if not data.get("name"):
+            return
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO authors (key, name) VALUES (?, ?)", (key, data["name"])
+        )
+        conn.execute(
+            "UPDATE works SET author_name = ? WHERE author_key = ? AND author_name IS NOT ?",
+            (data["name"], key, data["name"]),
+        )
+
+    def add_search_docs(self, docs):
+        rows = [
+            {
+                "key": doc["key"],
+                "title": doc["title"],
+                "author_key": None,
+                "author_name": ", ".join(doc.get("author_name") or ()) or None,
+                "subjects": None,
+                "cover_i": doc.get("cover_i"),
+                "cover_edition_key": doc.get("cover_edition_key"),
+            }
+            for doc in docs
+            if doc.get("key", "").startswith("/works/") and doc.get("title")
+        ]
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(UPSERT_WORK, rows)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def search(self, q, limit=fetch.SEARCH_LIMIT, offset=0):
+        """Best matches for `q` as search docs, most relevant first."""
+
+        expression = match_expression(q)
+        if expression is None:
+            return []
+        rows = self._connect().execute(
+            "SELECT w.key, w.title, w.author_name, w.cover_i, w.cover_edition_key"
+            " FROM works_fts JOIN works w ON w.rowid = works_fts.rowid"
+            " WHERE works_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+            (expression, limit, offset),
+        )
+        docs = []
+        for key, title, author_name, cover_i, cover_edition_key in rows:
+            doc = {"key": key, "title": title}
+            if author_name:
+                doc["author_name"] = author_name.split(", ")
+            if cover_i:
+                doc["cover_i"] = cover_i
+            if cover_edition_key:
+                doc["cover_edition_key"] = cover_edition_key
+            docs.append(doc)
+        return docs
+
+    def count(self):
+        return self._connect().execute("SELECT count(*) FROM works").fetchone()[0]
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM works")
+        conn.execute("DELETE FROM authors")
+
+
+def index_from_env():
+    """Open the index at SEARCH_INDEX_DB; an empty value disables it."""
+
+    path = os.environ.get(
+        "SEARCH_INDEX_DB", os.path.join(tempfile.gettempdir(), "books_lover_search.sqlite3")
+    )
+    return SearchIndex(path) if path else None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = index_from_env() or False
+    return _index or None
+
+
+def set_index(index):
+    global _index
+    with _index_lock:
+        _index = index
+
+
+def local_search(q, limit=fetch.SEARCH_LIMIT, offset=0):
+    """Search the local index; returns [] when it is disabled or unavailable."""
+
+    index = get_index()
+    if index is None:
+        return []
+    try:
+        return index.search(q, limit, offset)
+    except Exception:
+        logger.exception("Local search failed for %r", q)
+        return []
+
+
+def rebuild(book_keys=()):
+    """Re-create the index from cached payloads and the given work keys.
+
+    Works, authors and search results in the persistent cache tier are
+    indexed first, then `book_keys` (e.g. every favorited or reviewed book)
+    are resolved through the fetch layer and indexed. Returns the number of
+    indexed works.
+    """
+
+    index = get_index()
+    if index is None:
+        return 0
+    index.clear()
+
+    store = fetch.get_cache().store
+    if store is not None:
+        for key, data in store.items("works"):
+            index.add_work(key, data)
+        for key, data in store.items("authors"):
+            index.add_author(key, data)
+        for key, docs in store.items("search"):
+            index.add_search_docs(docs)
+
+    for key, found in zip(book_keys, fetch.resolve_books(book_keys)):
+        if found["book"]:
+            index.add_work(key, found["book"])
+        if found["author"]:
+            index.add_author(found["author"].get("key", ""), found["author"])
+    return index.count()
+
+
+def _index_work(key, data):
+    index = get_index()
+    if index is not None:
+        index.add_work(key, data)
+
+
+def _index_author(key, data):
+    index = get_index()
+    if index is not None:
+        index.add_author(key, data)
+
+
+def _index_search_docs(key, docs):
+    index = get_index()
+    if index is not None:
+        index.add_search_docs(docs)
+
+
+fetch.on_payload("works", _index_work)
+fetch.on_payload("authors", _index_author)
+fetch.on_payload("search", _index_search_docs)
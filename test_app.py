@@ -1,16 +1,18 @@
-import os
 from unittest import TestCase
 
+import afetch
+import fetch
+from cache import TieredCache
+from fake_openlibrary import FakeOpenLibrary
 from models import db, connect_db, Favorite, User, Review
+from app import create_app, get_book_async, CURR_USER_KEY
+from test_fetch import ROUTES
 
-os.environ["DATABASE_URL"] = "postgresql:///books_lover_tests"
-
-from app import app, CURR_USER_KEY
+app = create_app("test")
+app.app_context().push()
 
 db.create_all()
 
-app.config["WTF_CSRF_ENABLED"] = False
-
 
 class AppTestCase(TestCase):
     """Test app routes."""
@@ -38,6 +40,17 @@ class AppTestCase(TestCase):
 
         self.user_id = user.id
 
+    def fake_openlibrary(self, routes=ROUTES):
+        """Serve Open Library from a local fake for the rest of the test."""
+
+        server = FakeOpenLibrary(routes).start()
+        fetch.set_client(fetch.OpenLibraryClient(base_url=server.url, retries=0))
+        fetch.set_cache(TieredCache(ttls=fetch.CACHE_TTLS))
+        self.addCleanup(server.stop)
+        self.addCleanup(fetch.set_cache, None)
+        self.addCleanup(fetch.set_client, None)
+        return server
+
     def test_search_data(self):
         with self.client as c:
             with c.session_transaction() as sess:
@@ -65,6 +78,85 @@ class AppTestCase(TestCase):
                 self.assertEqual(resp.status_code, 200)
                 self.assertTrue(b"The 48 Laws of Power" in resp.data)
 
+    def test_page_cache_headers(self):
+        with self.client as c:
+            resp = c.get("/")
+            self.assertTrue(resp.cache_control.public)
+            self.assertNotIn("Set-Cookie", resp.headers)
+
+            # The redirect flashes "Access unauthorized." onto the home page.
+            c.get("/my/list")
+            resp = c.get("/")
+            self.assertIn(b"Access unauthorized.", resp.data)
+            self.assertFalse(resp.cache_control.public)
+            self.assertTrue(resp.cache_control.private)
+            self.assertTrue(resp.cache_control.no_cache)
+
+    def test_api_books(self):
+        self.fake_openlibrary()
+        with self.client as c:
+            resp = c.post(
+                "/api/books",
+                json={"keys": ["/works/OL1W", "not-a-key"], "fields": ["title"]},
+            )
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json["books"]["/works/OL1W"], {"title": "Test Book"})
+            self.assertEqual(resp.json["errors"], {"not-a-key": "invalid key"})
+
+            resp = c.get("/api/books?keys=/works/OL1W&fields=price")
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.post("/api/books", json=["/works/OL1W"])
+            self.assertEqual(resp.status_code, 400)
+
+    def test_api_books_malformed_payloads(self):
+        server = self.fake_openlibrary()
+        server.routes["/works/OL5W.json"] = ["not", "a", "work"]
+        server.routes["/works/OL6W.json"] = {"title": "Bad Covers", "covers": ["x"]}
+
+        resp = self.client.get(
+            "/api/books",
+            query_string={"keys": "works/OL1W,works/OL5W,works/OL6W", "fields": "title,cover"},
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json["books"]["works/OL1W"]["title"], "Test Book")
+        self.assertEqual(
+            resp.json["errors"], {"works/OL5W": "unavailable", "works/OL6W": "unavailable"}
+        )
+
+    def test_async_pages(self):
+        server = self.fake_openlibrary()
+        server.delays = {"/works/OL1W/ratings": 1}
+        afetch.set_client(afetch.AsyncOpenLibraryClient(base_url=server.url))
+        self.addCleanup(afetch.set_client, None)
+        async_app = create_app({**app.config, "FETCH_ASYNC": True, "BOOK_PAGE_DEADLINE": 0.3})
+        self.assertIs(async_app.view_functions["main.get_book"], get_book_async)
+        db.session.add(Favorite(status="read", user_id=self.user_id, book_id="works/OL1W"))
+        db.session.commit()
+
+        with async_app.test_client() as c:
+            # The ratings call misses the page deadline; the page renders without it.
+            resp = c.get("/works/OL1W/Test_Book")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Test Book", resp.data)
+            self.assertIn(b"Test Author", resp.data)
+            self.assertNotIn(b"4.2", resp.data)
+
+            resp = c.get("/authors/OL1A/author")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Test Author", resp.data)
+
+            resp = c.get("/search", query_string={"q": "test", "source": "remote"})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Test Book", resp.data)
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+            resp = c.get("/my/list")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Test Book", resp.data)
+
     def test_book_details(self):
         data = Review(
             text="test_text",
@@ -94,6 +186,52 @@ class AppTestCase(TestCase):
                 fav = Favorite.query.one()
                 self.assertEqual(fav.status, "read")
 
+    def test_list_only_shows_own_favorites(self):
+        other = User.signup(
+            first_name="Jane",
+            last_name="Doe",
+            username="otheruser",
+            email="other@test.com",
+            password="otheruser",
+            image_url=None,
+        )
+        db.session.commit()
+        db.session.add_all(
+            [
+                Favorite(status="read", user_id=self.user_id, book_id="works/OL1968368W"),
+                Favorite(status="read", user_id=other.id, book_id="works/OL82563W"),
+            ]
+        )
+        db.session.commit()
+        # Both works are served, so only the per-user query keeps the other out.
+        self.fake_openlibrary(
+            {
+                **ROUTES,
+                "/works/OL1968368W.json": {
+                    "key": "/works/OL1968368W",
+                    "title": "The 48 Laws of Power",
+                    "authors": [{"author": {"key": "/authors/OL1A"}}],
+                },
+                "/works/OL82563W.json": {
+                    "key": "/works/OL82563W",
+                    "title": "Harry Potter and the Philosopher's Stone",
+                    "authors": [{"author": {"key": "/authors/OL1A"}}],
+                },
+            }
+        )
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get("/my/list")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"The 48 Laws of Power", resp.data)
+            self.assertNotIn(b"Harry Potter", resp.data)
+
+            resp = c.get("/my/list?status=want+to+read")
+            self.assertIn(b"List is empty.", resp.data)
+
     # def test_delete_review(self):
     #     with self.client as c:
     #         with c.session_transaction() as sess:
@@ -0,0 +1,39 @@
+import time
+from unittest import TestCase
+
+from breaker import CircuitBreaker
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Test opening, the trial call and closing of the breaker."""
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(threshold=3, reset_after=60)
+        breaker.failure()
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+
+        breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.trips, 1)
+
+    def test_trial_call(self):
+        breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+        breaker.failure()
+        time.sleep(0.06)
+
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.trips, 2)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
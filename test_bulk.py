@@ -0,0 +1,127 @@
+import io
+from unittest import TestCase
+
+from bulk import (
+    file_format,
+    import_favorites,
+    import_reviews,
+    read_records,
+    RecordWriter,
+    Progress,
+    REVIEW_FIELDS,
+)
+from models import db, User, Favorite, Review, BookRating
+
+
+class BulkFormatTestCase(TestCase):
+    """Test reading and writing import files."""
+
+    def test_file_format(self):
+        self.assertEqual(file_format("reviews.CSV"), "csv")
+        self.assertEqual(file_format("reviews.jsonl"), "jsonl")
+        self.assertEqual(file_format("<stdin>", "csv"), "csv")
+
+    def test_round_trip(self):
+        record = {
+            "user_id": 1,
+            "username": "test",
+            "book_id": "/works/OL1W",
+            "text": 'Loved it, "truly"',
+            "user_rating": 5,
+            "timestamp": "2023-01-01 00:00:00",
+        }
+        for fmt in ("jsonl", "csv"):
+            f = io.StringIO()
+            writer = RecordWriter(f, fmt, REVIEW_FIELDS)
+            writer.write(record)
+            writer.write(record)
+            f.seek(0)
+
+            records = list(read_records(f, fmt))
+            self.assertEqual(len(records), 2)
+            self.assertEqual(records[0]["text"], record["text"])
+            self.assertEqual(str(records[0]["user_id"]), "1")
+
+
+class BulkImportTestCase(TestCase):
+    """Test imports into the test database."""
+
+    @classmethod
+    def setUpClass(cls):
+        from app import create_app
+
+        cls.context = create_app("test").app_context()
+        cls.context.push()
+        db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        cls.context.pop()
+
+    def setUp(self):
+        Favorite.query.delete()
+        Review.query.delete()
+        BookRating.query.delete()
+        User.query.delete()
+        user = User(
+            first_name="Test",
+            last_name="User",
+            email="test@test.com",
+            username="testuser",
+            password="HASHED_PASSWORD",
+        )
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        self.progress = lambda: Progress("test", out=io.StringIO())
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def status(self, book_id):
+        return Favorite.query.filter_by(user_id=self.user_id, book_id=book_id).one().status
+
+    def test_import_favorites(self):
+        db.session.add(Favorite(user_id=self.user_id, book_id="/works/OL1W", status="reading"))
+        db.session.commit()
+        records = [
+            {"username": "testuser", "book_id": "/works/OL1W", "status": "read"},
+            {"user_id": self.user_id, "book_id": "/works/OL2W", "status": "to-read"},
+            {"user_id": str(self.user_id), "book_id": "/works/OL2W", "status": "read"},
+            {"username": "nobody", "book_id": "/works/OL3W", "status": "read"},
+            {"user_id": self.user_id, "book_id": "", "status": "read"},
+        ]
+
+        counts = import_favorites(records, progress=self.progress())
+        self.assertEqual(counts, {"read": 5, "written": 1, "conflicts": 2, "rejected": 2})
+        self.assertEqual(self.status("/works/OL1W"), "reading")
+        self.assertEqual(self.status("/works/OL2W"), "read")
+
+        counts = import_favorites(records[:1], on_conflict="update", progress=self.progress())
+        self.assertEqual(counts["written"], 1)
+        self.assertEqual(self.status("/works/OL1W"), "read")
+        self.assertEqual(Favorite.query.count(), 2)
+
+    def test_import_reviews(self):
+        db.session.add(
+            Review(user_id=self.user_id, book_id="/works/OL1W", text="Good", user_rating=4)
+        )
+        db.session.commit()
+        records = [
+            {"username": "testuser", "book_id": "/works/OL1W", "text": "Again", "user_rating": 2},
+            {"user_id": self.user_id, "book_id": "/works/OL2W", "text": "Great", "user_rating": "5"},
+            {"user_id": self.user_id, "book_id": "/works/OL2W", "text": "Still great"},
+            {"username": "nobody", "book_id": "/works/OL2W", "text": "Who?"},
+        ]
+
+        counts = import_reviews(records, batch_size=2, progress=self.progress())
+        self.assertEqual(counts, {"read": 4, "written": 1, "conflicts": 2, "rejected": 1})
+        ratings = {r.book_id: (r.review_count, r.rating_sum) for r in BookRating.query}
+        self.assertEqual(ratings, {"/works/OL1W": (1, 4), "/works/OL2W": (1, 5)})
+
+        counts = import_reviews(records[:1], on_conflict="append", progress=self.progress())
+        self.assertEqual(counts["written"], 1)
+        self.assertEqual(db.session.get(BookRating, "/works/OL1W").review_count, 2)
+        self.assertEqual(db.session.get(BookRating, "/works/OL1W").rating_sum, 6)
+        self.assertEqual(Review.query.count(), 3)
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from cache import MISSING, LRUCache, SingleFlight, SQLiteStore, TieredCache
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the in-memory cache tier."""
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1, 60)
+        cache.set("b", 2, 60)
+        cache.get("a")
+        cache.set("c", 3, 60)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expiry(self):
+        cache = LRUCache()
+        cache.set("a", 1, 0.01)
+        time.sleep(0.02)
+
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+
+class TieredCacheTestCase(TestCase):
+    """Test the in-memory cache backed by the SQLite store."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_survives_restart(self):
+        TieredCache(store=SQLiteStore(self.path)).set("works", "/works/OL1W", {"title": "T"})
+
+        cache = TieredCache(store=SQLiteStore(self.path))
+        self.assertEqual(cache.get("works", "/works/OL1W"), {"title": "T"})
+        self.assertEqual(cache.stats()["store"]["hits"], 1)
+
+    def test_invalidate(self):
+        cache = TieredCache(store=SQLiteStore(self.path), ttls={"ratings": 60})
+        cache.set("ratings", "a", 1)
+        cache.set("ratings", "b", 2)
+        cache.set("works", "a", 3)
+
+        cache.invalidate("ratings", "a")
+        self.assertIs(cache.get("ratings", "a"), MISSING)
+        self.assertEqual(cache.get("ratings", "b"), 2)
+
+        cache.invalidate("ratings")
+        self.assertIs(cache.get("ratings", "b"), MISSING)
+        self.assertEqual(cache.get("works", "a"), 3)
+
+
+    def test_lock(self):
+        store = SQLiteStore(self.path)
+
+        self.assertTrue(store.acquire("works:a", 60))
+        self.assertFalse(SQLiteStore(self.path).acquire("works:a", 60))
+        self.assertTrue(store.locked("works:a"))
+        store.release("works:a")
+        self.assertTrue(store.acquire("works:a", 60))
+
+    def test_expired_lock(self):
+        store = SQLiteStore(self.path)
+        store.acquire("works:a", 0)
+
+        self.assertFalse(store.locked("works:a"))
+        self.assertTrue(store.acquire("works:a", 60))
+
+
+class SingleFlightTestCase(TestCase):
+    """Test coalescing of concurrent identical calls."""
+
+    def test_coalesced(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            leader = pool.submit(flight.do, "key", slow)
+            started.wait(5)
+            followers = [pool.submit(flight.do, "key", slow) for _ in range(3)]
+            while flight.coalesced < 3:
+                time.sleep(0.01)
+            release.set()
+
+            self.assertEqual(leader.result(), "result")
+            self.assertEqual([f.result() for f in followers], ["result"] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_exception_shared_then_cleared(self):
+        flight = SingleFlight()
+
+        with self.assertRaises(ValueError):
+            flight.do("key", lambda: int("x"))
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+
+    def test_cancelled_leader_hands_over(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        loop = asyncio.new_event_loop()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(5)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            task = loop.create_task(flight.do_async("key", slow))
+            running = pool.submit(loop.run_until_complete, task)
+            started.wait(5)
+            follower = pool.submit(flight.do, "key", lambda: "result")
+            while flight.coalesced < 1:
+                time.sleep(0.01)
+            loop.call_soon_threadsafe(task.cancel)
+
+            self.assertEqual(follower.result(5), "result")
+            with self.assertRaises(asyncio.CancelledError):
+                running.result(5)
+        loop.close()
+        self.assertEqual(flight.do("key", lambda: 2), 2)
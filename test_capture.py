@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+import requests
+
+from app import create_app, CURR_USER_KEY
+from fake_openlibrary import FakeOpenLibrary
+from models import db
+from replay import percentile
+
+
+class CaptureTestCase(TestCase):
+    """Test that captured requests are recorded without secrets."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        app = create_app(
+            {"SQLALCHEMY_DATABASE_URI": "sqlite://", "TRAFFIC_CAPTURE": self.path}
+        )
+        with app.app_context():
+            db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_records_sanitized_requests(self):
+        self.client.get("/metrics")
+        self.client.get("/api/books?keys=bad&token=abc")
+        self.client.post("/login", data={"username": "u", "password": "secret"})
+
+        with open(self.path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["route"] for line in lines], ["/api/books", "/login"])
+        self.assertEqual(lines[0]["query"], {"keys": ["bad"]})
+        self.assertEqual(lines[0]["status"], 200)
+        self.assertNotIn("form", lines[1])
+        self.assertNotIn("secret", json.dumps(lines))
+        self.assertFalse(lines[0]["authenticated"])
+
+    def test_records_logged_in_requests(self):
+        with self.client.session_transaction() as session:
+            session[CURR_USER_KEY] = 1
+        self.client.get("/api/books?keys=bad")
+
+        with open(self.path) as f:
+            self.assertTrue(json.loads(f.readline())["authenticated"])
+
+
+class ReplayTestCase(TestCase):
+    """Test the replay tool's percentiles and the fake Open Library it uses."""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_fixtures_and_route_latency(self):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        routes = {"/search.json": {"docs": []}, "/search.json?q=dune": {"docs": [1]}}
+        FakeOpenLibrary(routes).save(path)
+
+        with FakeOpenLibrary.from_fixtures(path, delays={"/search": 0.2}) as fake:
+            start = time.monotonic()
+            self.assertEqual(requests.get(f"{fake.url}/search.json?q=dune").json(), {"docs": [1]})
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+            self.assertEqual(requests.get(f"{fake.url}/search.json?q=x").json(), {"docs": []})
+            self.assertEqual(requests.get(f"{fake.url}/works/OL1W.json").status_code, 404)
@@ -0,0 +1,80 @@
+import io
+import os
+import tempfile
+import time
+from unittest import TestCase, skipUnless
+
+import covers
+from covers import CoverStore, DiskCache
+from fake_openlibrary import FakeOpenLibrary
+from fetch import OpenLibraryClient
+
+
+def jpeg(width=600, height=900):
+    out = io.BytesIO()
+    covers.Image.new("RGB", (width, height), (200, 120, 40)).save(out, "JPEG")
+    return out.getvalue()
+
+
+class DiskCacheTestCase(TestCase):
+    """Test the bounded on-disk cache."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.dir.name, max_bytes=250)
+        cache.set("a", b"a" * 100)
+        cache.set("b", b"b" * 100)
+        # Make "a" the most recently used despite coarse mtimes.
+        os.utime(cache._path("b"), (time.time() - 60, time.time() - 60))
+        cache.get("a")
+        cache.set("c", b"c" * 100)
+
+        self.assertEqual(cache.get("a"), b"a" * 100)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.size(), 200)
+
+
+class CoverStoreTestCase(TestCase):
+    """Test fetching and serving covers against a local fake server."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        original = jpeg() if covers.Image else b"\xff\xd8 original"
+        self.server = FakeOpenLibrary({"/b/id/12-L.jpg": original}).start()
+        self.store = CoverStore(
+            DiskCache(self.dir.name, 1024 * 1024), OpenLibraryClient(base_url=self.server.url)
+        )
+
+    def tearDown(self):
+        self.store.client.close()
+        self.server.stop()
+        self.dir.cleanup()
+
+    def test_fetched_once(self):
+        first = self.store.get("id", "12", "M")
+        second = self.store.get("id", "12", "S")
+
+        self.assertTrue(first[0])
+        self.assertTrue(second[0])
+        self.assertEqual(self.server.requests, ["/b/id/12-L.jpg?default=false"])
+
+    def test_missing_cover(self):
+        self.assertIsNone(self.store.get("id", "13", "M"))
+        self.assertIsNone(self.store.get("id", "13", "M"))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_invalid_value(self):
+        self.assertIsNone(self.store.get("id", "../etc", "M"))
+        self.assertEqual(self.server.requests, [])
+
+    @skipUnless(covers.Image, "Pillow is not installed")
+    def test_resized_variants(self):
+        data, mimetype = self.store.get("id", "12", "M", webp=True)
+
+        self.assertEqual(mimetype, "image/webp")
+        self.assertEqual(covers.Image.open(io.BytesIO(data)).width, 240)
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+import afetch
+import fetch
+from breaker import CircuitBreaker
+from cache import TieredCache
+from fake_openlibrary import FakeOpenLibrary
+
+ROUTES = {
+    "/works/OL1W.json": {
+        "key": "/works/OL1W",
+        "title": "Test Book",
+        "authors": [{"author": {"key": "/authors/OL1A"}}],
+    },
+    "/authors/OL1A.json": {"key": "/authors/OL1A", "name": "Test Author"},
+    "/works/OL1W/ratings.json": {"summary": {"average": 4.2, "count": 5}},
+    "/authors/OL1A/works.json": {"entries": [{"key": "/works/OL1W"}]},
+    "/search.json": {"docs": [{"key": "/works/OL1W", "title": "Test Book"}]},
+}
+
+
+class FetchTestCase(TestCase):
+    """Test Open Library fetchers against a local fake server."""
+
+    def setUp(self):
+        self.server = FakeOpenLibrary(ROUTES).start()
+        fetch.set_client(fetch.OpenLibraryClient(base_url=self.server.url, retries=0))
+        fetch.set_cache(TieredCache(ttls=fetch.CACHE_TTLS))
+
+    def tearDown(self):
+        fetch.set_client(None)
+        fetch.set_cache(None)
+        fetch._breakers.clear()
+        self.server.stop()
+
+    def test_fetchers(self):
+        self.assertEqual(fetch.get_books("/works/OL1W")["title"], "Test Book")
+        self.assertEqual(fetch.get_authors_details("/authors/OL1A")["name"], "Test Author")
+        self.assertEqual(fetch.get_ratings_details("/works/OL1W")["summary"]["count"], 5)
+        self.assertEqual(len(fetch.author_works("/authors/OL1A")["entries"]), 1)
+        self.assertEqual(fetch.search("test")[0]["title"], "Test Book")
+
+    def test_author_works_pages(self):
+        page = fetch.author_works("/authors/OL1A", limit=5, offset=5)
+        self.assertEqual(page["entries"], [{"key": "/works/OL1W", "title": None}])
+        fetch.author_works("/authors/OL1A", limit=5, offset=5)
+        fetch.author_works("/authors/OL1A", limit=5, offset=10)
+
+        self.assertEqual(
+            self.server.requests,
+            [
+                "/authors/OL1A/works.json?limit=5&offset=5",
+                "/authors/OL1A/works.json?limit=5&offset=10",
+            ],
+        )
+
+    def test_connection_reuse(self):
+        for key in ("/works/OL1W", "/authors/OL1A", "/works/OL1W/ratings"):
+            fetch.get_books(key)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.peers), 1)
+
+    def test_cached(self):
+        fetch.get_books("/works/OL1W")
+        fetch.get_books("/works/OL1W")
+        self.assertEqual(len(self.server.requests), 1)
+
+        fetch.invalidate("works", "/works/OL1W")
+        fetch.get_books("/works/OL1W")
+        self.assertEqual(len(self.server.requests), 2)
+        # One hit for the payload, one for the validators of the refetch.
+        self.assertEqual(fetch.cache_stats()["memory"]["hits"], 2)
+
+    def test_revalidation(self):
+        fetch.get_books("/works/OL1W")
+        fetch.invalidate("works", "/works/OL1W")
+
+        self.assertEqual(fetch.get_books("/works/OL1W")["title"], "Test Book")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.not_modified, 1)
+
+        self.server.routes["/works/OL1W.json"] = {"key": "/works/OL1W", "title": "New"}
+        fetch.invalidate("works", "/works/OL1W")
+        self.assertEqual(fetch.get_books("/works/OL1W")["title"], "New")
+        self.assertEqual(self.server.not_modified, 1)
+
+    def test_concurrent_fetches_coalesced(self):
+        self.server.delay = 0.2
+        before = fetch.flight_stats()["coalesced"]
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            books = list(pool.map(fetch.get_books, ["/works/OL1W"] * 5))
+
+        self.assertEqual([b["title"] for b in books], ["Test Book"] * 5)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(fetch.flight_stats()["coalesced"] - before, 4)
+
+    def test_stale_served_during_outage(self):
+        fetch.get_books("/works/OL1W")
+        fetch.invalidate("works", "/works/OL1W")
+        self.server.status = 503
+
+        self.assertEqual(fetch.get_books("/works/OL1W")["title"], "Test Book")
+        with self.assertRaises(fetch.UpstreamError):
+            fetch.get_authors_details("/authors/OL1A")
+        self.assertEqual(fetch.search("test"), [])
+
+    def test_malformed_payloads(self):
+        fetch.get_books("/works/OL1W")
+        fetch.invalidate("works", "/works/OL1W")
+        self.server.routes["/works/OL1W.json"] = ["not", "a", "work"]
+        self.server.routes["/authors/OL1A/works.json"] = ["not", "a", "page"]
+
+        self.assertEqual(fetch.get_books("/works/OL1W")["title"], "Test Book")
+        with self.assertRaises(fetch.UpstreamError):
+            fetch.author_works("/authors/OL1A")
+
+    def test_circuit_breaker(self):
+        self.server.status = 503
+        for _ in range(fetch.BREAKER_THRESHOLD):
+            with self.assertRaises(fetch.UpstreamError):
+                fetch.get_ratings_details("/works/OL1W")
+        requests_made = len(self.server.requests)
+
+        with self.assertRaises(fetch.UpstreamError):
+            fetch.get_ratings_details("/works/OL1W")
+        self.assertEqual(len(self.server.requests), requests_made)
+        self.assertEqual(fetch.breaker_for("ratings").state, "open")
+        # Other endpoints have their own breakers.
+        self.server.status = None
+        self.assertEqual(fetch.get_books("/works/OL1W")["title"], "Test Book")
+
+    def test_read_timeout_not_retried(self):
+        fetch.set_client(fetch.OpenLibraryClient(base_url=self.server.url, retries=2))
+        self.server.delay = 0.5
+        start = time.monotonic()
+        with mock.patch.dict(os.environ, {"OPENLIBRARY_TIMEOUT_RATINGS": "0.2"}):
+            with self.assertRaises(fetch.UpstreamError):
+                fetch.get_ratings_details("/works/OL1W")
+
+        self.assertLess(time.monotonic() - start, 0.45)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_breaker_trial_settled_on_bad_payload(self):
+        fetch._breakers["author_works"] = CircuitBreaker(threshold=1, reset_after=0)
+        self.server.status = 503
+        with self.assertRaises(fetch.UpstreamError):
+            fetch.author_works("/authors/OL1A")
+        self.server.status = None
+        # The half-open trial call gets a body `_works_page` cannot decode.
+        self.server.routes["/authors/OL1A/works.json"] = ["not", "a", "page"]
+        with self.assertRaises(fetch.UpstreamError):
+            fetch.author_works("/authors/OL1A")
+
+        self.server.routes["/authors/OL1A/works.json"] = ROUTES["/authors/OL1A/works.json"]
+        self.assertEqual(len(fetch.author_works("/authors/OL1A")["entries"]), 1)
+        self.assertEqual(fetch.breaker_for("author_works").state, "closed")
+
+    def test_errors_not_cached(self):
+        fetch.get_books("/works/OL2W")
+        fetch.get_books("/works/OL2W")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_search_pushdown(self):
+        fetch.search("test", limit=5, offset=10)
+
+        query = self.server.requests[0]
+        self.assertIn("limit=5", query)
+        self.assertIn("offset=10", query)
+        self.assertIn("fields=key%2Ctitle", query)
+
+    def test_search_error(self):
+        self.server.routes.pop("/search.json")
+        with self.assertLogs("fetch", "WARNING") as logs:
+            self.assertEqual(fetch.search("test"), [])
+        self.assertIn("HTTP 404", logs.output[0])
+
+    def test_resolve_books(self):
+        keys = ["/works/OL1W", "/works/OL2W", "/works/OL1W"]
+        resolved = fetch.resolve_books(keys)
+
+        self.assertEqual(len(resolved), 3)
+        self.assertEqual(resolved[0]["book"]["title"], "Test Book")
+        self.assertEqual(resolved[0]["author"]["name"], "Test Author")
+        self.assertIsNone(resolved[1]["author"])
+        self.assertEqual(resolved[2], resolved[0])
+        # OL1W, OL2W and one author: duplicates are fetched once.
+        self.assertEqual(len(self.server.requests), 3)
+
+
+class AsyncFetchTestCase(TestCase):
+    """Test the async fetchers against a local fake server."""
+
+    def setUp(self):
+        self.server = FakeOpenLibrary(ROUTES).start()
+        afetch.set_client(afetch.AsyncOpenLibraryClient(base_url=self.server.url))
+        fetch.set_cache(TieredCache(ttls=fetch.CACHE_TTLS))
+
+    def tearDown(self):
+        afetch.set_client(None)
+        fetch.set_cache(None)
+        self.server.stop()
+
+    def test_fetchers(self):
+        async def load():
+            return await asyncio.gather(
+                afetch.get_books("/works/OL1W"),
+                afetch.get_authors_details("/authors/OL1A"),
+                afetch.get_ratings_details("/works/OL1W"),
+                afetch.author_works("/authors/OL1A"),
+                afetch.search("test"),
+            )
+
+        book, author, rating, works, docs = asyncio.run(load())
+        self.assertEqual(book["title"], "Test Book")
+        self.assertEqual(author["name"], "Test Author")
+        self.assertEqual(rating["summary"]["count"], 5)
+        self.assertEqual(len(works["entries"]), 1)
+        self.assertEqual(docs[0]["title"], "Test Book")
+
+    def test_connection_reuse_across_loops(self):
+        asyncio.run(afetch.get_books("/works/OL1W"))
+        asyncio.run(afetch.get_authors_details("/authors/OL1A"))
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(self.server.peers), 1)
+
+    def test_resolve_books(self):
+        resolved = asyncio.run(afetch.resolve_books(["/works/OL1W", "/works/OL2W"]))
+
+        self.assertEqual(resolved[0]["author"]["name"], "Test Author")
+        self.assertIsNone(resolved[1]["author"])
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+import fragments
+from app import create_app
+
+
+class FragmentCacheTestCase(TestCase):
+    """Test caching and invalidation of rendered book fragments."""
+
+    def setUp(self):
+        fragments.cache.clear()
+        self.app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+        self.context = self.app.test_request_context("/")
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+        fragments.cache.clear()
+
+    def card(self, title):
+        return fragments.fragment(
+            "book_card", "/works/OL1W", title=title, cover=("id", 1), authors=["A"]
+        )
+
+    def test_reuses_rendered_copy(self):
+        html = self.card("Test Book")
+        self.assertIn("Test Book", html)
+        self.assertIn("/covers/id/1-M", html)
+        self.assertIn("by A", html)
+
+        misses = fragments.cache.misses
+        self.assertIs(self.card("Test Book"), html)
+        self.assertEqual(fragments.cache.misses, misses)
+
+    def test_changed_payload(self):
+        self.card("Test Book")
+        self.assertIn("New Title", self.card("New Title"))
+
+    def test_invalidate(self):
+        self.card("Test Book")
+        fragments.invalidate("works/OL1W")
+
+        self.assertEqual(fragments.cache.stats()["size"], 0)
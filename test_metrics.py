@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import fetch
+import metrics
+from cache import TieredCache
+from fake_openlibrary import FakeOpenLibrary
+from test_fetch import ROUTES
+
+
+class RegistryTestCase(TestCase):
+    """Test the Prometheus histograms."""
+
+    def test_render(self):
+        registry = metrics.Registry()
+        registry.describe("latency_seconds", "Latency.", (0.1, 1))
+        registry.observe("latency_seconds", 0.05, route="/")
+        registry.observe("latency_seconds", 0.5, route="/")
+        registry.observe("latency_seconds", 5, route="/")
+
+        text = registry.render()
+        self.assertIn("# TYPE latency_seconds histogram", text)
+        self.assertIn('latency_seconds_bucket{route="/",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{route="/"} 3', text)
+
+
+class RequestTimingsTestCase(TestCase):
+    """Test that upstream time is attributed to the current request."""
+
+    def setUp(self):
+        self.server = FakeOpenLibrary(ROUTES).start()
+        fetch.set_client(fetch.OpenLibraryClient(base_url=self.server.url))
+        fetch.set_cache(TieredCache())
+        self.timings = metrics.RequestTimings()
+        self.token = metrics.current.set(self.timings)
+
+    def tearDown(self):
+        metrics.current.reset(self.token)
+        fetch.set_client(None)
+        fetch.set_cache(None)
+        self.server.stop()
+
+    def test_upstream_on_pool_threads(self):
+        fetch.resolve_books(["/works/OL1W"])
+
+        self.assertEqual(set(self.timings.upstream), {"works", "authors"})
+
+    def test_server_timing(self):
+        fetch.search("test")
+        header = metrics.server_timing(self.timings, 0.01)
+
+        self.assertTrue(header.startswith("upstream-search;dur="))
+        self.assertIn('sql;dur=0.0;desc="0 queries"', header)
+        self.assertTrue(header.endswith("total;dur=10.0"))
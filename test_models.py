@@ -1,17 +1,17 @@
-import os
 from unittest import TestCase
 
 from psycopg2 import IntegrityError
-from models import db, User, Favorite, Review
+from models import db, User, Favorite, Review, Book, Author, BookRating
 from flask_bcrypt import Bcrypt
+from passwords import BCRYPT_LOG_ROUNDS, hash_password, hash_rounds
 
 bcrypt = Bcrypt()
 
 
-os.environ["DATABASE_URL"] = "postgresql:///books_lover_tests"
+from app import create_app
 
-
-from app import app
+app = create_app("test")
+app.app_context().push()
 
 db.drop_all()
 db.create_all()
@@ -26,6 +26,8 @@ class UserModelTestCase(TestCase):
         User.query.delete()
         Favorite.query.delete()
         Review.query.delete()
+        Book.query.delete()
+        Author.query.delete()
 
         self.client = app.test_client()
 
@@ -93,6 +95,23 @@ class UserModelTestCase(TestCase):
         self.assertIsNotNone(u)
         self.assertTrue("testuser1", "HASHED_PASSWORD")
 
+    def test_authentication_rehashes(self):
+        user = User(
+            first_name="Test",
+            last_name="User",
+            email="test@test.com",
+            username="testuser",
+            password=hash_password("HASHED_PASSWORD", rounds=4),
+        )
+        db.session.add(user)
+        db.session.commit()
+
+        u = User.authenticate("testuser", "HASHED_PASSWORD")
+        db.session.commit()
+
+        self.assertEqual(hash_rounds(u.password), BCRYPT_LOG_ROUNDS)
+        self.assertTrue(bcrypt.check_password_hash(u.password, "HASHED_PASSWORD"))
+
 
 class FavoritesTestCase(TestCase):
     """Test favorites model."""
@@ -103,6 +122,8 @@ class FavoritesTestCase(TestCase):
         User.query.delete()
         Favorite.query.delete()
         Review.query.delete()
+        Book.query.delete()
+        Author.query.delete()
         user = User(
             first_name="Test",
             last_name="User",
@@ -142,6 +163,8 @@ class ReviewModelTestCase(TestCase):
         User.query.delete()
         Favorite.query.delete()
         Review.query.delete()
+        Book.query.delete()
+        Author.query.delete()
         user = User(
             first_name="Test",
             last_name="User",
@@ -173,3 +196,64 @@ class ReviewModelTestCase(TestCase):
         self.assertEqual(review.book_id, "21")
         self.assertEqual(review.text, "test_text")
         self.assertEqual(review.user_rating, 3)
+
+    def test_review_aggregates(self):
+        BookRating.query.delete()
+        first = Review(text="a", user_id=self.user.id, book_id="21", user_rating=3)
+        second = Review(text="b", user_id=self.user.id, book_id="21", user_rating=5)
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        stats = BookRating.query.get("21")
+        self.assertEqual(stats.review_count, 2)
+        self.assertEqual(stats.average, 4)
+
+        first.user_rating = 1
+        db.session.delete(second)
+        db.session.commit()
+        db.session.refresh(stats)
+
+        self.assertEqual(stats.review_count, 1)
+        self.assertEqual(stats.rating_sum, 1)
+
+
+class BookModelTestCase(TestCase):
+    """Test stored book details."""
+
+    def setUp(self):
+        """Create test client, add sample data."""
+
+        User.query.delete()
+        Favorite.query.delete()
+        Review.query.delete()
+        Book.query.delete()
+        Author.query.delete()
+        user = User(
+            first_name="Test",
+            last_name="User",
+            email="test@test.com",
+            username="testuser",
+            password="HASHED_PASSWORD",
+        )
+        db.session.add(user)
+        db.session.commit()
+        self.user = user
+        self.client = app.test_client()
+
+    def tearDown(self):
+        response = super().tearDown()
+        db.session.rollback()
+        return response
+
+    def test_favorite_book(self):
+        author = Author(key="/authors/OL1A", name="Test Author")
+        book = Book(key="works/OL1W", title="Test Book", covers=[1], author=author)
+        fav = Favorite(status="read", book_id="works/OL1W", user_id=self.user.id)
+        db.session.add_all([book, fav])
+        db.session.commit()
+
+        favorite = Favorite.query.get(fav.id)
+
+        self.assertEqual(favorite.book.title, "Test Book")
+        self.assertEqual(favorite.book.covers, [1])
+        self.assertEqual(favorite.book.author.name, "Test Author")
@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+import passwords
+from passwords import HashPool
+
+
+class PasswordsTestCase(TestCase):
+    """Test password hashing off the request thread."""
+
+    def setUp(self):
+        passwords.set_pool(HashPool(workers=1))
+
+    def tearDown(self):
+        passwords.set_pool(HashPool())
+
+    def test_hash_and_check(self):
+        hashed = passwords.hash_password("secret123", rounds=4)
+
+        self.assertEqual(passwords.hash_rounds(hashed), 4)
+        self.assertTrue(passwords.check_password(hashed, "secret123"))
+        self.assertFalse(passwords.check_password(hashed, "wrong"))
+
+    def test_needs_rehash(self):
+        hashed = passwords.hash_password("secret123", rounds=4)
+
+        self.assertFalse(passwords.needs_rehash(hashed, rounds=4))
+        self.assertTrue(passwords.needs_rehash(hashed, rounds=5))
+        self.assertTrue(passwords.needs_rehash("not a hash", rounds=4))
@@ -0,0 +1,57 @@
+import time
+from unittest import TestCase
+
+import fetch
+import prefetch
+from cache import TieredCache
+from fake_openlibrary import FakeOpenLibrary
+from test_fetch import ROUTES
+
+
+class TokenBucketTestCase(TestCase):
+    """Test the prefetcher's rate limit."""
+
+    def test_burst_then_rate(self):
+        bucket = prefetch.TokenBucket(rate=20, burst=2)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0))
+
+        start = time.monotonic()
+        self.assertTrue(bucket.acquire(timeout=1))
+        self.assertGreater(time.monotonic() - start, 0.03)
+
+
+class PrefetcherTestCase(TestCase):
+    """Test warming book pages in the background."""
+
+    def setUp(self):
+        self.server = FakeOpenLibrary(ROUTES).start()
+        fetch.set_client(fetch.OpenLibraryClient(base_url=self.server.url, retries=0))
+        fetch.set_cache(TieredCache())
+
+    def tearDown(self):
+        fetch.set_client(None)
+        fetch.set_cache(None)
+        self.server.stop()
+
+    def test_warms_book_page(self):
+        prefetcher = prefetch.Prefetcher(workers=2, rate=100, burst=10, max_pending=10)
+        for future in prefetcher.warm(["/works/OL1W", "/works/OL1W"]):
+            future.result()
+        self.assertEqual(prefetcher.counts["warmed"], 1)
+
+        requests = len(self.server.requests)
+        fetch.get_books("works/OL1W")
+        fetch.get_authors_details("/authors/OL1A")
+        fetch.get_ratings_details("works/OL1W")
+        self.assertEqual(len(self.server.requests), requests)
+
+    def test_drops_beyond_queue(self):
+        prefetcher = prefetch.Prefetcher(workers=1, rate=100, burst=10, max_pending=1)
+        futures = prefetcher.warm(["/works/OL1W", "/works/OL2W"])
+        for future in futures:
+            future.result()
+
+        self.assertEqual(len(futures), 1)
+        self.assertEqual(prefetcher.counts["dropped"], 1)
@@ -0,0 +1,59 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from search_index import SearchIndex, match_expression
+
+
+class SearchIndexTestCase(TestCase):
+    """Test the local full-text search index."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.index = SearchIndex(self.path)
+
+    def tearDown(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_match_expression(self):
+        self.assertEqual(match_expression('new "moon'), '"new"* "moon"*')
+        self.assertIsNone(match_expression("  "))
+
+    def test_work_and_author(self):
+        self.index.add_work(
+            "works/OL1W",
+            {
+                "key": "/works/OL1W",
+                "title": "New Moon",
+                "covers": [123],
+                "subjects": ["Vampires"],
+                "authors": [{"author": {"key": "/authors/OL1A"}}],
+            },
+        )
+        self.index.add_author("/authors/OL1A", {"name": "Stephenie Meyer"})
+
+        docs = self.index.search("meyer vamp")
+        self.assertEqual(
+            docs,
+            [
+                {
+                    "key": "/works/OL1W",
+                    "title": "New Moon",
+                    "author_name": ["Stephenie Meyer"],
+                    "cover_i": 123,
+                }
+            ],
+        )
+
+    def test_search_docs_update(self):
+        self.index.add_search_docs([{"key": "/works/OL1W", "title": "New Moon"}])
+        self.index.add_search_docs(
+            [{"key": "/works/OL1W", "title": "New Moon", "cover_edition_key": "OL2M"}]
+        )
+
+        self.assertEqual(self.index.count(), 1)
+        self.assertEqual(self.index.search("moon")[0]["cover_edition_key"], "OL2M")
+        self.assertEqual(self.index.search("twilight"), [])
@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+import fetch
+from cache import TieredCache
+from trending import Snapshot
+
+
+class SnapshotTestCase(TestCase):
+    """Test the background-refreshed snapshot."""
+
+    def setUp(self):
+        fetch.set_cache(TieredCache())
+
+    def tearDown(self):
+        fetch.set_cache(None)
+
+    def test_keeps_last_good_value(self):
+        values = iter([["a"], RuntimeError("upstream down")])
+
+        def loader():
+            value = next(values)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        snapshot = Snapshot("test", loader, default=[])
+        self.assertTrue(snapshot.refresh())
+        self.assertFalse(snapshot.refresh())
+        self.assertEqual(snapshot.value, ["a"])
+        self.assertEqual(snapshot.failures, 1)
+
+    def test_restores_persisted_value(self):
+        Snapshot("test", lambda: ["a"]).refresh()
+
+        snapshot = Snapshot("test", lambda: ["b"], default=[])
+        snapshot._restore()
+        self.assertEqual(snapshot.value, ["a"])
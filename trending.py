@@ -0,0 +1,108 @@
+import logging
+import os
+import threading
+import time
+
+from cache import MISSING
+from fetch import get_books, get_cache
+
+logger = logging.getLogger(__name__)
+
+TRENDING_SUBJECT = "/trending/yearly"
+TRENDING_LIMIT = 18
+
+
+class Snapshot:
+    """Precomputed value refreshed by a background thread.
+
+    `get` never waits on `loader`: it returns the last good value (or
+    `default` before the first refresh succeeds). A failed refresh keeps the
+    previous value. The last good value is also written to the persistent
+    cache tier so restarted workers start warm.
+    """
+
+    def __init__(
+        self,
+        name,
+        loader,
+        interval=900,
+        retry_interval=30,
+        default=None,
+        keep_for=7 * 24 * 60 * 60,
+    ):
+        self.name = name
+        self.loader = loader
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.default = default
+        self.keep_for = keep_for
+        self.value = MISSING
+        self.refreshed_at = None
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def get(self):
+        self._ensure_started()
+        if self.value is MISSING:
+            return self.default
+        if time.time() - self.refreshed_at > self.interval:
+            # Stale: serve it anyway and nudge the scheduler.
+            self._wake.set()
+        return self.value
+
+    def refresh(self):
+        """Load a new value now; returns False if the loader failed."""
+
+        try:
+            value = self.loader()
+        except Exception:
+            self.failures += 1
+            logger.exception("Refreshing the %s snapshot failed", self.name)
+            return False
+        self.value, self.refreshed_at = value, time.time()
+        get_cache().set("snapshots", self.name, [self.refreshed_at, value], ttl=self.keep_for)
+        return True
+
+    def _restore(self):
+        saved = get_cache().get("snapshots", self.name)
+        if saved is not MISSING:
+            self.refreshed_at, self.value = saved
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each worker starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            try:
+                self._restore()
+            except Exception:
+                logger.exception("Restoring the %s snapshot failed", self.name)
+            threading.Thread(
+                target=self._run, name=f"snapshot-{self.name}", daemon=True
+            ).start()
+
+    def _run(self):
+        while True:
+            if self.value is MISSING or time.time() - self.refreshed_at >= self.interval:
+                if not self.refresh():
+                    time.sleep(self.retry_interval)
+                    continue
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+def load_trending():
+    return get_books(TRENDING_SUBJECT).get("works")[:TRENDING_LIMIT]
+
+
+trending = Snapshot(
+    "trending",
+    load_trending,
+    interval=int(os.environ.get("TRENDING_REFRESH_INTERVAL", 15 * 60)),
+    default=[],
+)